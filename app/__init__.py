@@ -0,0 +1,73 @@
+"""
+Application factory.
+
+create_app() builds a configured app; importing the package does not. The
+views and CLI commands are only imported when an app is created, and
+Flask-Migrate only when `flask db` runs. Nothing connects to the database
+before the first request.
+
+Pre-fork servers may build the app once in the master (see wsgi.py):
+after every fork the child drops its inherited pooled connections,
+password hashing processes and purge and EXPLAIN threads, and creates its own on
+first use.
+"""
+import os
+import weakref
+
+from flask import Flask
+
+
+def create_app(config=None):
+    """
+    Build the Flask app.
+
+    Args:
+        config: Mapping applied over config.py and the environment
+
+    Returns:
+        Flask
+    """
+    from .models import db
+    from .metrics import Instrumentation
+    from .querybudget import QueryBudget
+    from .ratelimit import RateLimiter
+    from .slowlog import SlowQueryLog
+    from .replicas import ReplicaRouter
+    from .app import api, jwt, collect_hashing_metrics
+    from .commands import commands
+
+    app = Flask(__name__)
+    app.config.from_pyfile('config.py')
+    app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "your-secret-key")  # Replace in production
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    jwt.init_app(app)
+    Instrumentation(app, db).add_collector(collect_hashing_metrics)
+    QueryBudget(app, db)
+    SlowQueryLog(app, db)
+    RateLimiter(app)
+    ReplicaRouter(app, db)
+
+    app.register_blueprint(api)
+    app.register_blueprint(commands)
+
+    app_ref = weakref.ref(app)
+    os.register_at_fork(after_in_child=lambda: _after_fork(app_ref))
+    return app
+
+
+def _after_fork(app_ref):
+    """Let a forked child open its own connections and worker pools instead of sharing the parent's."""
+    from .models import db
+
+    app = app_ref()
+    if app is None:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            # close=False leaves the sockets to the parent, which still uses them
+            engine.dispose(close=False)
+    for name in ('hash_pool', 'purge_executor', 'explain_executor'):
+        app.extensions.pop(name, None)
@@ -0,0 +1,103 @@
+import math
+
+from sqlalchemy import cast, delete, false, func, insert, select, text, update, String
+
+from .archive import all_records
+from .models import db, SpendingTotal
+
+# Totals are float sums whose rounding error grows with their size, so they
+# match within a relative tolerance (and an absolute one for totals near zero)
+TOLERANCE = 1e-9
+ABSOLUTE_TOLERANCE = 1e-6
+
+
+def month_of(column):
+    """SQL expression formatting a datetime column as 'YYYY-MM'."""
+    if db.engine.dialect.name == 'sqlite':
+        return func.strftime('%Y-%m', column)
+    return func.to_char(column, 'YYYY-MM')
+
+
+def compute_spending():
+    """
+    Recompute every spending total from the record table and the archive.
+
+    Returns:
+        dict: (dimension, key) -> (total, count)
+    """
+    records = all_records()
+    groupings = {
+        'user': cast(records.user_id, String),
+        'category': cast(records.category_id, String),
+        'month': month_of(records.date_time),
+    }
+    totals = {}
+    for dimension, key in groupings.items():
+        stmt = select(key, func.sum(records.amount), func.count(records.id)).group_by(key)
+        for value, total, count in db.session.execute(stmt):
+            totals[(dimension, value)] = (total, count)
+    return totals
+
+
+def stored_spending():
+    return {
+        (row.dimension, row.key): (row.total, row.count)
+        for row in SpendingTotal.query
+        if row.count
+    }
+
+
+def find_drift(expected, stored):
+    """
+    Compare recomputed totals with the stored ones.
+
+    Returns:
+        list: (dimension, key, expected, stored) for every mismatching key
+    """
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        want = expected.get(key, (0.0, 0))
+        have = stored.get(key, (0.0, 0))
+        if want[1] != have[1] or not math.isclose(want[0], have[0], rel_tol=TOLERANCE, abs_tol=ABSOLUTE_TOLERANCE):
+            drift.append((*key, want, have))
+    return drift
+
+
+def lock_spending():
+    """
+    Keep records and spending totals from changing until the transaction ends.
+
+    Record writes update the totals in their own transaction, so holding
+    off writes to spending_total holds off new records too. Postgres still
+    lets the totals be read; on SQLite a write takes the database lock.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('LOCK TABLE spending_total IN EXCLUSIVE MODE'))
+    else:
+        db.session.execute(update(SpendingTotal).where(false()).values(count=SpendingTotal.count))
+
+
+def rebuild_spending(check_only=False):
+    """
+    Recompute the spending totals and report drift from the stored values.
+
+    Unless ``check_only`` is set the stored totals are replaced in a single
+    transaction. It locks them first, so a record written meanwhile can
+    neither be missed by the recount nor have its update wiped by it, and a
+    check compares both sides at the same point.
+    """
+    lock_spending()
+    expected = compute_spending()
+    drift = find_drift(expected, stored_spending())
+    if check_only:
+        db.session.rollback()
+        return drift
+
+    db.session.execute(delete(SpendingTotal))
+    if expected:
+        db.session.execute(insert(SpendingTotal.__table__), [
+            {'dimension': dimension, 'key': key, 'total': total, 'count': count}
+            for (dimension, key), (total, count) in expected.items()
+        ])
+    db.session.commit()
+    return drift
@@ -1,20 +1,28 @@
-from flask import Flask, jsonify, request
-from flask_sqlalchemy import SQLAlchemy
-import os
-from flask_migrate import Migrate
-from marshmallow import Schema, fields, validates, validates_schema, ValidationError
+from flask import Blueprint, current_app, jsonify, request, stream_with_context
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from marshmallow import Schema, fields, validate, validates, validates_schema, post_load, ValidationError, EXCLUDE
 from datetime import datetime
-from .models import db, User, Category, Record, Account
+from hashlib import sha1
+from .models import db, User, Category, Record, Account, SpendingTotal, PurgeJob
+from .pagination import PageSchema, paginate, encode_cursor, decode_cursor
+from .hashing import HashingBusy, get_pool, verify_password
+from .cache import versioned, invalidate
+from .metrics import render
+from .querybudget import query_budget
+from .ratelimit import rate_cost
+from .replicas import read_only
+from .serializers import RowSerializer, json_response
+from .export import ndjson_lines, csv_lines, chunked, gzipped
+from .purge import OWNERS, purge_owner, start_purge
+from .archive import all_records
+from .ledger import balance_at, statement
+from .reports import BUCKETS, GROUPINGS, rollup_state, is_closed, spending_report
 from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, jwt_required
-from passlib.hash import pbkdf2_sha256
 
-app = Flask(__name__)
-app.config.from_pyfile('config.py')
-app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "your-secret-key")  # Replace in production
-jwt = JWTManager(app)
-
-db.init_app(app)
-migrate = Migrate(app, db)
+# Registered on the app by create_app()
+api = Blueprint('api', __name__)
+jwt = JWTManager()
 
 
 # Schemas
@@ -36,7 +44,7 @@ class UserSchema(Schema):
 class AccountSchema(Schema):
     id = fields.Int(dump_only=True)
     user_id = fields.Int(required=True)
-    balance = fields.Float(dump_only=True)
+    balance = fields.Float(dump_only=True, attribute='total_balance')
     initial_balance = fields.Float(load_only=True, missing=0.0)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
@@ -54,6 +62,13 @@ class DepositSchema(Schema):
         if value <= 0:
             raise ValidationError('Amount must be positive')
 
+class LedgerEntrySchema(Schema):
+    id = fields.Int(dump_only=True)
+    amount = fields.Float(dump_only=True)
+    kind = fields.Str(dump_only=True)
+    record_id = fields.Int(dump_only=True)
+    created_at = fields.DateTime(dump_only=True)
+
 class CategorySchema(Schema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True)
@@ -63,7 +78,7 @@ class CategorySchema(Schema):
         if len(value.strip()) < 2:
             raise ValidationError('Name must be at least 2 characters long')
 
-class RecordSchema(Schema):
+class RecordFieldsSchema(Schema):
     id = fields.Int(dump_only=True)
     user_id = fields.Int(required=True)
     category_id = fields.Int(required=True)
@@ -75,22 +90,97 @@ class RecordSchema(Schema):
         if value <= 0:
             raise ValidationError('Amount must be positive')
 
+class RecordSchema(RecordFieldsSchema):
     @validates_schema
     def validate_associations(self, data, **kwargs):
         user = User.query.get(data['user_id'])
         if not user:
             raise ValidationError('User does not exist')
             
-        category = Category.query.get(data['category_id'])
+        category, _ = cached_category(data['category_id'])
         if not category:
             raise ValidationError('Category does not exist')
-            
-        account = Account.query.filter_by(user_id=data['user_id']).first()
-        if not account:
-            raise ValidationError('User has no account')
-            
-        if account.balance < data['amount']:
-            raise ValidationError('Insufficient funds')
+
+class RecordBatchSchema(Schema):
+    records = fields.List(fields.Dict(), required=True)
+    mode = fields.Str(load_default='atomic', validate=validate.OneOf(['atomic', 'partial']))
+
+    @validates('records')
+    def validate_records(self, value):
+        limit = current_app.config['BATCH_MAX_RECORDS']
+        if not 1 <= len(value) <= limit:
+            raise ValidationError(f'Batch must contain between 1 and {limit} records')
+
+class ListQuerySchema(PageSchema):
+    class Meta:
+        unknown = EXCLUDE
+
+class BalanceQuerySchema(Schema):
+    at = fields.DateTime()
+
+    class Meta:
+        unknown = EXCLUDE
+
+class StatementQuerySchema(ListQuerySchema):
+    date_from = fields.DateTime(data_key='from')
+    date_to = fields.DateTime(data_key='to')
+
+class RecordFilterSchema(Schema):
+    user_id = fields.Int()
+    category_id = fields.Int()
+    date_from = fields.DateTime(data_key='from')
+    date_to = fields.DateTime(data_key='to')
+
+    class Meta:
+        unknown = EXCLUDE
+
+class RecordQuerySchema(ListQuerySchema, RecordFilterSchema):
+    pass
+
+class RecordExportSchema(RecordFilterSchema):
+    format = fields.Str(load_default='ndjson', validate=validate.OneOf(['ndjson', 'csv']))
+    cursor = fields.Str(load_default=None)
+    after_id = fields.Int()
+
+class SummaryQuerySchema(Schema):
+    user_id = fields.Int()
+    category_id = fields.Int()
+    month = fields.Str(validate=validate.Regexp(r'^\d{4}-\d{2}$', error='Month must be YYYY-MM'))
+
+    class Meta:
+        unknown = EXCLUDE
+
+    @validates_schema
+    def validate_any(self, data, **kwargs):
+        if not data:
+            raise ValidationError('Specify user_id, category_id or month')
+
+class DeleteQuerySchema(Schema):
+    mode = fields.Str(load_default='sync', validate=validate.OneOf(['sync', 'async']))
+
+    class Meta:
+        unknown = EXCLUDE
+
+class SlowQueryReportSchema(Schema):
+    limit = fields.Int(load_default=20, validate=validate.Range(min=1, max=100))
+
+    class Meta:
+        unknown = EXCLUDE
+
+class ReportQuerySchema(RecordFilterSchema):
+    bucket = fields.Str(load_default='month', validate=validate.OneOf(BUCKETS))
+    group_by = fields.Str(load_default='')
+
+    @validates('group_by')
+    def validate_group_by(self, value):
+        unknown = set(filter(None, value.split(','))) - set(GROUPINGS)
+        if unknown:
+            raise ValidationError(f"Cannot group by {', '.join(sorted(unknown))}")
+
+    @post_load
+    def split_group_by(self, data, **kwargs):
+        data['group_by'] = tuple(name for name in GROUPINGS if name in data['group_by'].split(','))
+        return data
 
 # Initialize schemas
 user_schema = UserSchema()
@@ -101,31 +191,101 @@ category_schema = CategorySchema()
 categories_schema = CategorySchema(many=True)
 record_schema = RecordSchema()
 records_schema = RecordSchema(many=True)
+record_fields_schema = RecordFieldsSchema()
+record_batch_schema = RecordBatchSchema()
 deposit_schema = DepositSchema()
+ledger_entries_schema = LedgerEntrySchema(many=True)
+user_rows = RowSerializer(user_schema, User)
+account_rows = RowSerializer(account_schema, Account)
+category_rows = RowSerializer(category_schema, Category)
+record_rows = RowSerializer(record_schema, Record)
+list_query_schema = ListQuerySchema()
+record_query_schema = RecordQuerySchema()
+record_export_schema = RecordExportSchema()
+summary_query_schema = SummaryQuerySchema()
+report_query_schema = ReportQuerySchema()
+delete_query_schema = DeleteQuerySchema()
+balance_query_schema = BalanceQuerySchema()
+statement_query_schema = StatementQuerySchema()
+slow_query_report_schema = SlowQueryReportSchema()
+
+# Helpers
+def cached_category(id):
+    """Category dump (False if missing) served from the category cache"""
+    def load():
+        category = db.session.get(Category, id)
+        return category_schema.dump(category) if category else False
+    return versioned('categories', f'id:{id}', load)
+
+def filter_records(query, args, records=Record):
+    """Apply the record list filters from RecordQuerySchema to a query or select() over Record or all_records()"""
+    if 'user_id' in args:
+        query = query.filter(records.user_id == args['user_id'])
+    if 'category_id' in args:
+        query = query.filter(records.category_id == args['category_id'])
+    if 'date_from' in args:
+        query = query.filter(records.date_time >= args['date_from'])
+    if 'date_to' in args:
+        query = query.filter(records.date_time < args['date_to'])
+    return query
+
+def conditional_json(data, etag):
+    """JSON response (data may be pre-encoded, or a loader only called on a miss) tagged with an ETag, or 304 if the client already has it"""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        if callable(data):
+            data = data()
+        response = json_response(data) if isinstance(data, str) else jsonify(data)
+    response.set_etag(etag)
+    return response
+
+def queue_purge(kind, id, missing):
+    """202 with the background purge job of a user or category"""
+    model, _ = OWNERS[kind]
+    if db.session.get(model, id) is None:
+        return jsonify({'error': missing}), 404
+    job = start_purge(kind, id)
+    return jsonify(job.to_dict()), 202, {'Location': f'/purges/{job.id}'}
+
+def collect_hashing_metrics(metrics):
+    pool = current_app.extensions.get('hash_pool')
+    if pool is not None:
+        stats = pool.stats()
+        metrics.set('password_hash_queue_depth', {}, stats['queue_depth'])
+        metrics.set('password_hash_completed', {}, stats['completed'])
+        metrics.set('password_hash_rejected', {}, stats['rejected'])
+        metrics.set('password_hash_seconds', {}, stats['hash_seconds_total'])
 
 # Error handlers
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found_error(error):
     return jsonify({'error': 'Resource not found'}), 404
 
-@app.errorhandler(405)
+@api.app_errorhandler(405)
 def method_not_allowed_error(error):
     return jsonify({'error': 'Method not allowed'}), 405
 
-@app.errorhandler(ValidationError)
+@api.app_errorhandler(ValidationError)
 def validation_error(error):
     return jsonify({'error': 'Validation error', 'messages': error.messages}), 400
 
-@app.errorhandler(Exception)
+@api.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    return jsonify({'error': str(error)}), 503, {'Retry-After': '1'}
+
+@api.app_errorhandler(Exception)
 def handle_error(error):
     return jsonify({'error': str(error)}), 500
 
 # User endpoints
-@app.route('/register', methods=['POST'])
+@api.route('/register', methods=['POST'])
+@query_budget(5)
+@rate_cost(10)
 def register():
     try:
         data = user_schema.load(request.json)
-        existing_user = User.query.filter_by(name=data['name']).first()
+        existing_user = User.by_name(data['name'])
         
         if existing_user:
             return jsonify({'error': 'Username already exists'}), 400
@@ -135,20 +295,38 @@ def register():
         return user_schema.dump(user), 201
     except ValidationError as err:
         return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
+    except IntegrityError as e:
+        db.session.rollback()
+        # Only a concurrent registration of the same name is the client's fault; an id collision is ours
+        if User.by_name(data['name']) is not None:
+            return jsonify({'error': 'Username already exists'}), 400
+        return jsonify({'error': str(e.orig)}), 500
+    except HashingBusy as err:
+        db.session.rollback()
+        return hashing_busy(err)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
+@query_budget(1)
+@read_only
 @jwt_required()
 def get_users():
     try:
-        users = User.query.all()
-        return users_schema.dump(users)
+        args = list_query_schema.load(request.args)
+        users, next_cursor = paginate(
+            db.session.query(*user_rows.columns), [User.id], args['limit'], args['cursor']
+        )
+        return json_response(user_rows.encode_page(users, next_cursor))
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/users/<int:id>', methods=['GET'])
+@api.route('/users/<int:id>', methods=['GET'])
+@query_budget(1)
+@read_only
 def get_user(id):
     try:
         user = User.query.get(id)
@@ -158,22 +336,27 @@ def get_user(id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/users/<int:id>', methods=['DELETE'])
+@api.route('/users/<int:id>', methods=['DELETE'])
+@query_budget(12)
+@rate_cost(10)
 @jwt_required()
 def delete_user(id):
     try:
-        user = User.query.get(id)
-        if user is None:
+        args = delete_query_schema.load(request.args)
+        if args['mode'] == 'async':
+            return queue_purge('user', id, 'User not found')
+        if purge_owner('user', id) is None:
             return jsonify({'error': 'User not found'}), 404
-        db.session.delete(user)
-        db.session.commit()
         return jsonify({'message': 'User successfully deleted'}), 200
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 # Account endpoints
-@app.route('/accounts', methods=['POST'])
+@api.route('/accounts', methods=['POST'])
+@query_budget(7)
 @jwt_required()
 def create_account():
     try:
@@ -182,7 +365,7 @@ def create_account():
         if not user:
             return jsonify({'error': 'User not found'}), 404
             
-        existing_account = Account.query.filter_by(user_id=data['user_id']).first()
+        existing_account = Account.for_user(data['user_id'])
         if existing_account:
             return jsonify({'error': 'User already has an account'}), 400
             
@@ -195,11 +378,18 @@ def create_account():
         return account_schema.dump(account), 201
     except ValidationError as err:
         return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
+    except IntegrityError as e:
+        db.session.rollback()
+        if Account.for_user(data['user_id']) is not None:
+            return jsonify({'error': 'User already has an account'}), 400
+        return jsonify({'error': str(e.orig)}), 500
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/accounts/<int:id>', methods=['GET'])
+@api.route('/accounts/<int:id>', methods=['GET'])
+@query_budget(1)
+@read_only
 @jwt_required()
 def get_account(id):
     try:
@@ -210,18 +400,19 @@ def get_account(id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/accounts/<int:id>/deposit', methods=['POST'])
+@api.route('/accounts/<int:id>/deposit', methods=['POST'])
+@query_budget(4)
 @jwt_required()
 def deposit_to_account(id):
     try:
         data = deposit_schema.load(request.json)
-        account = Account.query.get(id)
+        account = Account.deposit(id, data['amount'])
         if account is None:
             return jsonify({'error': 'Account not found'}), 404
-            
-        account.deposit(data['amount'])
+        # Dumped before the commit expires it, so the response needs no reload
+        result = account_schema.dump(account)
         db.session.commit()
-        return account_schema.dump(account)
+        return result
     except ValidationError as err:
         return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
     except ValueError as err:
@@ -230,19 +421,50 @@ def deposit_to_account(id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/accounts/<int:id>/balance', methods=['GET'])
+@api.route('/accounts/<int:id>/balance', methods=['GET'])
+@query_budget(3)
+@read_only
 @jwt_required()
 def get_balance(id):
     try:
+        args = balance_query_schema.load(request.args)
         account = Account.query.get(id)
         if account is None:
             return jsonify({'error': 'Account not found'}), 404
-        return jsonify({'balance': account.balance})
+        if 'at' in args:
+            return jsonify({'balance': balance_at(id, args['at'])})
+        return jsonify({'balance': account.total_balance})
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/accounts/<int:id>/statement', methods=['GET'])
+@query_budget(6)
+@read_only
+@jwt_required()
+def get_statement(id):
+    try:
+        args = statement_query_schema.load(request.args)
+        if db.session.get(Account, id) is None:
+            return jsonify({'error': 'Account not found'}), 404
+        opening, closing, entries, next_cursor = statement(
+            id, args.get('date_from'), args.get('date_to'), args['limit'], args['cursor']
+        )
+        return jsonify({
+            'opening_balance': opening,
+            'closing_balance': closing,
+            'items': ledger_entries_schema.dump(entries),
+            'next': next_cursor
+        })
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Category endpoints
-@app.route('/categories', methods=['POST'])
+@api.route('/categories', methods=['POST'])
+@query_budget(4)
 @jwt_required()
 def create_category():
     try:
@@ -250,6 +472,7 @@ def create_category():
         category = Category(name=data['name'])
         db.session.add(category)
         db.session.commit()
+        invalidate('categories')
         return category_schema.dump(category), 201
     except ValidationError as err:
         return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
@@ -257,42 +480,60 @@ def create_category():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/categories', methods=['GET'])
+@api.route('/categories', methods=['GET'])
+@query_budget(1)
 @jwt_required()
 def get_categories():
     try:
-        categories = Category.query.all()
-        return categories_schema.dump(categories)
+        args = list_query_schema.load(request.args)
+
+        def load_page():
+            categories, next_cursor = paginate(
+                db.session.query(*category_rows.columns), [Category.id], args['limit'], args['cursor']
+            )
+            return category_rows.encode_page(categories, next_cursor)
+
+        page, version = versioned('categories', f"list:{args['limit']}:{args['cursor']}", load_page)
+        return conditional_json(page, f'categories-{version}')
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/categories/<int:id>', methods=['GET'])
+@api.route('/categories/<int:id>', methods=['GET'])
+@query_budget(1)
 @jwt_required()
 def get_category(id):
     try:
-        category = Category.query.get(id)
-        if category is None:
+        category, version = cached_category(id)
+        if not category:
             return jsonify({'error': 'Category not found'}), 404
-        return category_schema.dump(category)
+        return conditional_json(category, f'category-{id}-{version}')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/categories/<int:id>', methods=['DELETE'])
+@api.route('/categories/<int:id>', methods=['DELETE'])
+@query_budget(8)
+@rate_cost(10)
 @jwt_required()
 def delete_category(id):
     try:
-        category = Category.query.get(id)
-        if category is None:
+        args = delete_query_schema.load(request.args)
+        if args['mode'] == 'async':
+            return queue_purge('category', id, 'Category not found')
+        if purge_owner('category', id) is None:
             return jsonify({'error': 'Category not found'}), 404
-        db.session.delete(category)
-        db.session.commit()
         return jsonify({'message': 'Category successfully deleted'}), 200
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 # Record endpoints
-@app.route('/records', methods=['POST'])
+@api.route('/records', methods=['POST'])
+@query_budget(10)
+@rate_cost(2)
 @jwt_required()
 def create_record():
     try:
@@ -311,37 +552,231 @@ def create_record():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/records', methods=['GET'])
+@api.route('/records/batch', methods=['POST'])
+@query_budget(11)
+@rate_cost(10)
+@jwt_required()
+def create_record_batch():
+    try:
+        data = record_batch_schema.load(request.json)
+        items = []
+        errors = {}
+        for index, item in enumerate(data['records']):
+            try:
+                items.append((index, record_fields_schema.load(item)))
+            except ValidationError as err:
+                errors[index] = err.messages
+
+        atomic = data['mode'] == 'atomic'
+        created = []
+        if items and not (atomic and errors):
+            batch_created, batch_errors = Record.create_batch(
+                [item for _, item in items], atomic=atomic
+            )
+            created = [(items[i][0], row) for i, row in batch_created]
+            errors.update({items[i][0]: message for i, message in batch_errors.items()})
+
+        response = {
+            'created': [dict(record_schema.dump(row), index=index) for index, row in created],
+            'errors': [{'index': index, 'error': errors[index]} for index in sorted(errors)]
+        }
+        if atomic and errors:
+            return jsonify(response), 400
+        return jsonify(response), 201 if created else 400
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/records', methods=['GET'])
+@query_budget(1)
+@read_only
 @jwt_required()
 def get_records():
     try:
-        records = Record.query.all()
-        return records_schema.dump(records)
+        args = record_query_schema.load(request.args)
+        source = all_records(args.get('date_from'), args.get('date_to'))
+        records, next_cursor = paginate(
+            filter_records(db.session.query(*record_rows.columns_for(source)), args, source),
+            [source.date_time, source.id], args['limit'], args['cursor']
+        )
+        return json_response(record_rows.encode_page(records, next_cursor))
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/records/export', methods=['GET'])
+@query_budget(2)
+@rate_cost(20)
+@read_only
+@jwt_required()
+def export_records():
+    try:
+        args = record_export_schema.load(request.args)
+        source = all_records(args.get('date_from'), args.get('date_to'))
+        columns = [source.date_time, source.id]
+        query = filter_records(db.session.query(*record_rows.columns_for(source)), args, source)
+
+        # Resume after a dropped connection from the last record received
+        if 'after_id' in args:
+            last = db.session.query(*columns).filter(source.id == args['after_id']).first()
+            if last is None:
+                return jsonify({'error': 'Record not found'}), 404
+            args['cursor'] = encode_cursor(list(last))
+        if args['cursor'] is not None:
+            query = query.filter(tuple_(*columns) > tuple_(*decode_cursor(args['cursor'], columns)))
+
+        rows = query.order_by(*columns).execution_options(yield_per=1000)
+        if args['format'] == 'csv':
+            body, mimetype = chunked(csv_lines(rows, record_rows)), 'text/csv'
+        else:
+            body, mimetype = chunked(ndjson_lines(rows, record_rows)), 'application/x-ndjson'
+
+        headers = {
+            'Content-Disposition': f"attachment; filename=records.{args['format']}",
+            'Vary': 'Accept-Encoding'
+        }
+        if request.accept_encodings['gzip'] > 0:
+            body = gzipped(body)
+            headers['Content-Encoding'] = 'gzip'
+        return current_app.response_class(stream_with_context(body), mimetype=mimetype, headers=headers)
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/records/<int:id>', methods=['GET'])
+@api.route('/records/<int:id>', methods=['GET'])
+@query_budget(1)
+@read_only
 @jwt_required()
 def get_record(id):
     try:
-        record = Record.query.get(id)
+        source = all_records()
+        record = db.session.query(source).filter(source.id == id).first()
         if record is None:
             return jsonify({'error': 'Record not found'}), 404
         return record_schema.dump(record)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/login', methods=['POST'])
+# Purge endpoints
+@api.route('/purges/<int:id>', methods=['GET'])
+@query_budget(1)
+@read_only
+@jwt_required()
+def get_purge(id):
+    job = db.session.get(PurgeJob, id)
+    if job is None:
+        return jsonify({'error': 'Purge job not found'}), 404
+    return jsonify(job.to_dict())
+
+@api.route('/hashing/stats', methods=['GET'])
+@query_budget(0)
+@jwt_required()
+def get_hashing_stats():
+    return jsonify(get_pool().stats())
+
+@api.route('/metrics', methods=['GET'])
+@query_budget(0)
+@rate_cost(0)
+def get_metrics():
+    return render(current_app.extensions['metrics'].collect()), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+@api.route('/admin/slow-queries', methods=['GET'])
+@query_budget(0)
+@jwt_required()
+def get_slow_queries():
+    args = slow_query_report_schema.load(request.args)
+    return jsonify({'items': current_app.extensions['slow_queries'].report(args['limit'])})
+
+# Summary endpoints
+@api.route('/summary', methods=['GET'])
+@query_budget(1)
+@rate_cost(5)
+@read_only
+@jwt_required()
+def get_summary():
+    try:
+        args = summary_query_schema.load(request.args)
+        wanted = {}
+        if 'user_id' in args:
+            wanted['user'] = str(args['user_id'])
+        if 'category_id' in args:
+            wanted['category'] = str(args['category_id'])
+        if 'month' in args:
+            wanted['month'] = args['month']
+
+        rows = SpendingTotal.query.filter(
+            tuple_(SpendingTotal.dimension, SpendingTotal.key).in_(list(wanted.items()))
+        ).all()
+        found = {row.dimension: row for row in rows}
+        return jsonify({
+            dimension: {
+                'key': key,
+                'total': found[dimension].total if dimension in found else 0.0,
+                'count': found[dimension].count if dimension in found else 0
+            }
+            for dimension, key in wanted.items()
+        })
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Report endpoints
+@api.route('/reports/spending', methods=['GET'])
+@query_budget(3)
+@rate_cost(5)
+@read_only
+@jwt_required()
+def get_spending_report():
+    try:
+        args = report_query_schema.load(request.args)
+        rolled_until, version = rollup_state()
+
+        def load():
+            rows = spending_report(args['bucket'], args['group_by'], args, rolled_until)
+            return {'bucket': args['bucket'], 'group_by': list(args['group_by']), 'rows': rows}
+
+        if not is_closed(args, rolled_until):
+            response = jsonify(load())
+            response.cache_control.no_cache = True
+            return response
+
+        # A closed range only changes when old records do, which bumps the rollup version
+        key = f'{version}:{sorted(args.items())}'
+        etag = f'report-{version}-{sha1(key.encode()).hexdigest()[:16]}'
+        response = conditional_json(lambda: versioned('reports', key, load)[0], etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['REPORT_MAX_AGE']
+        return response
+    except ValidationError as err:
+        return jsonify({'error': 'Validation error', 'messages': err.messages}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/login', methods=['POST'])
+@query_budget(2)
+@rate_cost(10)
 def login():
     try:
         data = request.get_json()
-        user = User.query.filter_by(name=data['name']).first()
+        user = User.by_name(data['name'])
+        valid, new_hash = verify_password(data['password'], user.password) if user else (False, None)
+        user_id = user.id if user else None
+        if valid and new_hash:
+            user.password = new_hash
+            db.session.commit()
         
-        if user and pbkdf2_sha256.verify(data['password'], user.password):
-            access_token = create_access_token(identity=user.id)
+        if valid:
+            access_token = create_access_token(identity=user_id)
             return jsonify({'access_token': access_token}), 200
             
         return jsonify({'error': 'Invalid credentials'}), 401
+    except HashingBusy as err:
+        return hashing_busy(err)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -368,4 +803,5 @@ def missing_token_callback(error):
     }), 401
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    from . import create_app
+    create_app().run(debug=True)
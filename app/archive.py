@@ -0,0 +1,148 @@
+"""
+Archival of old records.
+
+archive_records() moves records older than a cutoff from the record table
+into record_archive, a month at a time, and keeps one archive_partition
+row per archived month as a manifest. The hot table and its indexes then
+only hold recent records.
+
+Reads go through all_records(), which unions both tables into a single
+statement. The archive branch is guarded by an uncorrelated check against
+the manifest, so the database skips it when no archived month overlaps the
+requested range; filters and keyset conditions are pushed into each branch
+and served by its indexes.
+"""
+from datetime import date, datetime, time, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, literal, select, union_all
+from sqlalchemy.orm import aliased
+
+from .models import db, Record, RecordArchive, ArchivePartition
+
+COLUMNS = [column.name for column in Record.__table__.c]
+
+
+def all_records(date_from=None, date_to=None):
+    """
+    Record aliased over the record table and the archive.
+
+    Args:
+        date_from: Only archived months ending at or after this datetime are read
+        date_to: Only archived months starting before this datetime are read
+
+    Returns:
+        AliasedClass: usable like Record in queries; rows load as Record
+    """
+    archive = RecordArchive.__table__
+    partitions = select(ArchivePartition.month)
+    cold = select(*[archive.c[name] for name in COLUMNS])
+    if date_from is not None:
+        partitions = partitions.where(ArchivePartition.last_date_time >= date_from)
+        cold = cold.where(archive.c.date_time >= date_from)
+    if date_to is not None:
+        partitions = partitions.where(ArchivePartition.first_date_time < date_to)
+        cold = cold.where(archive.c.date_time < date_to)
+    records = union_all(select(Record.__table__), cold.where(partitions.exists())).subquery('records')
+    return aliased(Record, records)
+
+
+def records_with_archived(condition):
+    """
+    Rows of both tables matching ``condition``, tagged with where they live.
+
+    Args:
+        condition: Function of Record or RecordArchive returning a filter
+
+    Returns:
+        Subquery: record columns plus a boolean ``archived``
+    """
+    return union_all(*[
+        select(*[model.__table__.c[name] for name in COLUMNS], literal(archived).label('archived'))
+        .where(condition(model))
+        for model, archived in ((Record, False), (RecordArchive, True))
+    ]).subquery('records')
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def move_records(ids):
+    """Move the given records into record_archive; returns how many moved."""
+    record, archive = Record.__table__, RecordArchive.__table__
+    condition = record.c.id.in_(ids)
+    if db.engine.dialect.name == 'postgresql':
+        # One statement, so a concurrent purge cannot delete a row between the copy and the delete
+        moved = delete(record).where(condition).returning(*record.c).cte('moved')
+        return db.session.execute(insert(archive).from_select(COLUMNS, select(moved))).rowcount
+    # SQLite runs one writer at a time, so the two statements see the same rows
+    db.session.execute(insert(archive).from_select(COLUMNS, select(record).where(condition)))
+    return db.session.execute(delete(record).where(condition), execution_options={'synchronize_session': False}).rowcount
+
+
+def update_partition(month, ids, moved):
+    """Add a chunk of ``moved`` records just archived under ``ids`` to the manifest row of ``month``."""
+    first, last = db.session.execute(
+        select(func.min(RecordArchive.date_time), func.max(RecordArchive.date_time))
+        .where(RecordArchive.id.in_(ids))
+    ).one()
+    partition = db.session.get(ArchivePartition, month)
+    if partition is None:
+        partition = ArchivePartition(month=month, records=0, first_date_time=first, last_date_time=last)
+        db.session.add(partition)
+    partition.records += moved
+    partition.first_date_time = min(partition.first_date_time, first)
+    partition.last_date_time = max(partition.last_date_time, last)
+    partition.archived_at = datetime.utcnow()
+
+
+def archive_records(before=None, report=None):
+    """
+    Move records older than ``before`` into record_archive.
+
+    Every chunk of ARCHIVE_CHUNK_SIZE records is moved and added to its
+    month's manifest row in its own short transaction. Spending totals and
+    the daily rollup are left alone: archived records still count.
+
+    Args:
+        before: Cutoff datetime (default: ARCHIVE_AFTER_DAYS ago)
+        report: Called with (month, records moved) after each month
+
+    Returns:
+        int: number of archived records
+    """
+    if before is None:
+        days = current_app.config.get('ARCHIVE_AFTER_DAYS', 365)
+        before = datetime.combine(datetime.utcnow().date(), time()) - timedelta(days=days)
+    chunk = current_app.config.get('ARCHIVE_CHUNK_SIZE', 5000)
+    total = 0
+    while True:
+        # Each pass empties the oldest month left, so the next one starts later
+        oldest = db.session.scalar(select(func.min(Record.date_time)).where(Record.date_time < before))
+        if oldest is None:
+            break
+        month = month_start(oldest)
+        start, end = datetime.combine(month, time()), min(datetime.combine(next_month(month), time()), before)
+        moved = 0
+        while True:
+            ids = db.session.scalars(
+                select(Record.id).where(Record.date_time >= start, Record.date_time < end)
+                .order_by(Record.id).limit(chunk).with_for_update()
+            ).all()
+            if not ids:
+                break
+            count = move_records(ids)
+            if count:
+                update_partition(month, ids, count)
+            moved += count
+            db.session.commit()
+        if report:
+            report(month, moved)
+        total += moved
+    db.session.commit()
+    return total
@@ -0,0 +1,206 @@
+"""
+ASGI entry point serving the read endpoints on an async SQLAlchemy engine.
+
+    uvicorn app.asgi:app --workers 4
+
+The GET endpoints below run on an AsyncSession, so a single worker keeps
+many requests in flight while they wait on the database. They are all
+@read_only views, so they read from a replica under the same rules as
+in synchronous mode (see replicas.py). Every other
+route is handed to the Flask app through asgiref's WSGI adapter, so both
+modes serve the same API. The synchronous mode (``flask run`` or any WSGI
+server on ``app.wsgi:app``) is unchanged.
+"""
+import asyncio
+import io
+import re
+
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import g, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request
+from marshmallow import ValidationError
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from . import create_app
+from .app import (
+    filter_records, list_query_schema, record_query_schema, balance_query_schema,
+    user_schema, account_schema, record_schema, user_rows, record_rows,
+)
+from .archive import all_records
+from .ledger import checkpoint_query, delta_query
+from .models import User, Account
+from .pagination import keyset_filter, finish_page
+from .serializers import json_response
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(url):
+    """Swap the driver of a sync database URL for its asyncio counterpart."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def build_environ(scope):
+    """WSGI environ of a bodiless request, built exactly as the WSGI adapter builds it for the other routes."""
+    # Keeps the client address, scheme, server and root_path the rate limiter and url_for rely on
+    adapter = WsgiToAsgiInstance(None)
+    adapter.scope = scope
+    return adapter.build_environ(scope, io.BytesIO())
+
+
+# Views, mirroring their counterparts in app.py
+async def get_users(session):
+    args = list_query_schema.load(request.args)
+    stmt = keyset_filter(select(*user_rows.columns), [User.id], args['limit'], args['cursor'])
+    users, next_cursor = finish_page((await session.execute(stmt)).all(), [User.id], args['limit'])
+    return json_response(user_rows.encode_page(users, next_cursor))
+
+
+async def get_user(session, id):
+    user = await session.get(User, id)
+    if user is None:
+        return jsonify({'error': 'User not found'}), 404
+    return user_schema.dump(user)
+
+
+async def get_account(session, id):
+    account = await session.get(Account, id)
+    if account is None:
+        return jsonify({'error': 'Account not found'}), 404
+    return account_schema.dump(account)
+
+
+async def get_balance(session, id):
+    args = balance_query_schema.load(request.args)
+    balance = await session.scalar(select(Account.total_balance).where(Account.id == id))
+    if balance is None:
+        return jsonify({'error': 'Account not found'}), 404
+    if 'at' in args:
+        checkpoint = (await session.scalars(checkpoint_query(id, args['at']))).first()
+        delta = await session.scalar(delta_query(id, checkpoint, args['at']))
+        balance = (checkpoint.balance if checkpoint else 0.0) + delta
+    return jsonify({'balance': balance})
+
+
+async def get_records(session):
+    args = record_query_schema.load(request.args)
+    source = all_records(args.get('date_from'), args.get('date_to'))
+    columns = [source.date_time, source.id]
+    stmt = keyset_filter(filter_records(select(*record_rows.columns_for(source)), args, source), columns, args['limit'], args['cursor'])
+    records, next_cursor = finish_page((await session.execute(stmt)).all(), columns, args['limit'])
+    return json_response(record_rows.encode_page(records, next_cursor))
+
+
+async def get_record(session, id):
+    source = all_records()
+    record = (await session.scalars(select(source).where(source.id == id))).first()
+    if record is None:
+        return jsonify({'error': 'Record not found'}), 404
+    return record_schema.dump(record)
+
+
+# (pattern, view, requires JWT)
+ROUTES = [
+    (re.compile(r'/users'), get_users, True),
+    (re.compile(r'/users/(?P<id>\d+)'), get_user, False),
+    (re.compile(r'/accounts/(?P<id>\d+)'), get_account, True),
+    (re.compile(r'/accounts/(?P<id>\d+)/balance'), get_balance, True),
+    (re.compile(r'/records'), get_records, True),
+    (re.compile(r'/records/(?P<id>\d+)'), get_record, True),
+]
+
+
+class AsyncApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        # Keyed like g.read_bind: None is the primary, 'replica0', ... the read replicas
+        self.engines = {}
+        self.sessionmakers = {}
+
+    def _ensure_engines(self):
+        # Created on first use so each forked worker gets its own pools
+        if self.engines:
+            return
+        config = self.flask_app.config
+        replicas = self.flask_app.extensions.get('replicas')
+        urls = {None: config['SQLALCHEMY_DATABASE_URI']}
+        urls.update((key, config['SQLALCHEMY_BINDS'][key]) for key in (replicas.keys if replicas else []))
+        for key, url in urls.items():
+            engine = create_async_engine(async_url(url), **config.get('SQLALCHEMY_ASYNC_ENGINE_OPTIONS', {}))
+            self.engines[key] = engine
+            self.sessionmakers[key] = async_sessionmaker(engine, expire_on_commit=False)
+            for name in ('metrics', 'query_budget'):
+                extension = self.flask_app.extensions.get(name)
+                if extension is not None:
+                    extension.instrument_engine(engine.sync_engine)
+            if 'slow_queries' in self.flask_app.extensions:
+                self.flask_app.extensions['slow_queries'].instrument_engine(engine.sync_engine, async_engine=engine)
+
+    async def dispose(self):
+        """Close every pooled connection, e.g. at shutdown."""
+        for engine in self.engines.values():
+            await engine.dispose()
+        self.engines = {}
+        self.sessionmakers = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            for pattern, view, protected in ROUTES:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    params = {k: int(v) for k, v in match.groupdict().items()}
+                    await self._dispatch(scope, send, view, params, protected)
+                    return
+
+        await self.wsgi(scope, receive, send)
+
+    async def _dispatch(self, scope, send, view, params, protected):
+        self._ensure_engines()
+        with self.flask_app.request_context(build_environ(scope)):
+            try:
+                # Run the app's before/after request hooks as Flask would; the
+                # replica router picks g.read_bind there, as for the sync views.
+                # They are blocking (cache, rate-limit store, metrics files), so
+                # they run on a thread, which sees this request context.
+                result = await asyncio.to_thread(self.flask_app.preprocess_request)
+                if result is None:
+                    if protected:
+                        verify_jwt_in_request()
+                    async with self.sessionmakers[g.get('read_bind')]() as session:
+                        result = await view(session, **params)
+            except ValidationError as err:
+                result = jsonify({'error': 'Validation error', 'messages': err.messages}), 400
+            except Exception as e:
+                result = self.flask_app.handle_user_exception(e)
+            response = await asyncio.to_thread(self.flask_app.process_response, self.flask_app.make_response(result))
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncApp(create_app())
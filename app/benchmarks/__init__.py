@@ -0,0 +1,32 @@
+"""Standalone benchmarks, run with ``python -m app.benchmarks.<name>``."""
+import os
+import tempfile
+
+from flask import Flask
+
+from ..models import db
+
+
+def make_app(database_uri=None, **config):
+    """Build a bare app bound to ``database_uri`` (a temp SQLite file by default)."""
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_uri = f'sqlite:///{path}'
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.update(config)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
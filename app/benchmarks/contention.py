@@ -0,0 +1,100 @@
+"""
+Throughput of one hot account, kept on a single row or sharded over slots.
+
+Every worker count runs twice against a fresh account: once with the
+balance on the account row and once spread over --slots AccountSlot rows.
+Each run checks the final balance against the successful operations.
+
+SQLite serializes all writers on the database file, so sharding cannot
+show a difference there; point --database-uri at Postgres to measure it.
+
+    python -m app.benchmarks.contention --database-uri postgresql://... --workers 1 4 16
+"""
+import argparse
+import random
+import threading
+import time
+
+from . import make_app, percentile
+from ..models import db, User, Account
+
+
+def worker(app, user_id, account_id, seed, ops, results, lock):
+    rng = random.Random(seed)
+    samples, deposited, withdrawn, rejected = [], 0.0, 0.0, 0
+    with app.app_context():
+        for _ in range(ops):
+            amount = float(rng.randint(1, 20))
+            start = time.perf_counter()
+            try:
+                if rng.random() < 0.5:
+                    Account.deposit(account_id, amount)
+                    deposited += amount
+                else:
+                    Account.withdraw(user_id, amount)
+                    withdrawn += amount
+                db.session.commit()
+            except ValueError:
+                db.session.rollback()
+                rejected += 1
+            samples.append((time.perf_counter() - start) * 1e3)
+    with lock:
+        results.append((samples, deposited, withdrawn, rejected))
+
+
+def run(app, workers, ops, initial, slots):
+    with app.app_context():
+        user = User(name=f'bench-{time.time_ns()}', password='bench-password')
+        account = Account(user_id=user.id, initial_balance=initial)
+        db.session.commit()
+        if slots > 1:
+            Account.shard(account.id, slots)
+            db.session.commit()
+        user_id, account_id = user.id, account.id
+
+    results, lock = [], threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(app, user_id, account_id, seed, ops, results, lock))
+        for seed in range(workers)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = [s for r in results for s in r[0]]
+    expected = initial + sum(r[1] for r in results) - sum(r[2] for r in results)
+    with app.app_context():
+        balance = db.session.get(Account, account_id).total_balance
+    if abs(balance - expected) > 1e-6 or balance < 0:
+        raise SystemExit(f'balance mismatch: {balance:.2f}, expected {expected:.2f}')
+    return len(samples) / elapsed, percentile(samples, 99), sum(r[3] for r in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--ops', type=int, default=200)
+    parser.add_argument('--slots', type=int, default=8)
+    parser.add_argument('--initial', type=float, default=1000.0)
+    args = parser.parse_args()
+
+    app = make_app(
+        args.database_uri,
+        SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}}
+        if args.database_uri is None else {'pool_size': max(args.workers) + 1},
+    )
+
+    print(f'{"workers":>7}  {"layout":<10} {"ops/s":>8} {"p99 ms":>8} {"rejected":>8}')
+    for workers in args.workers:
+        for slots in (0, args.slots):
+            ops_per_second, p99, rejected = run(app, workers, args.ops, args.initial, slots)
+            layout = f'{slots} slots' if slots else 'single'
+            print(f'{workers:>7}  {layout:<10} {ops_per_second:>8.0f} {p99:>8.2f} {rejected:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Insert latency of id allocation as the table grows.
+
+    python -m app.benchmarks.id_allocation --sizes 1000,100000,1000000
+"""
+import argparse
+import time
+
+from sqlalchemy import delete, func, insert, select
+
+from . import make_app, percentile
+from ..models import db, Category, FreeId
+
+
+def fill(target):
+    """Bulk-load categories until the table holds ``target`` rows."""
+    current = db.session.execute(select(func.count(Category.id))).scalar()
+    batch = 50000
+    while current < target:
+        size = min(batch, target - current)
+        db.session.execute(
+            insert(Category.__table__),
+            [{'name': f'category-{current + i}'} for i in range(size)],
+        )
+        current += size
+    db.session.commit()
+
+
+def run(mode, sizes, inserts, gaps):
+    app = make_app(ID_ALLOCATION=mode)
+    results = []
+    with app.app_context():
+        for size in sizes:
+            fill(size)
+            if mode == 'freelist':
+                # Delete rows spread over the table, as the ORM would, so
+                # allocation has released ids to hand back out
+                step = max(1, size // gaps)
+                ids = db.session.execute(
+                    select(Category.id).where(Category.id % step == 0).limit(gaps)
+                ).scalars().all()
+                db.session.execute(delete(Category).where(Category.id.in_(ids)))
+                db.session.execute(
+                    insert(FreeId.__table__),
+                    [{'table_name': 'category', 'id': id} for id in ids],
+                )
+                db.session.commit()
+
+            samples = []
+            for i in range(inserts):
+                start = time.perf_counter()
+                Category(name=f'bench-{size}-{i}')
+                db.session.commit()
+                samples.append((time.perf_counter() - start) * 1e6)
+
+            results.append({
+                'mode': mode,
+                'rows': size,
+                'mean_us': sum(samples) / len(samples),
+                'p99_us': percentile(samples, 99),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--inserts', type=int, default=500)
+    parser.add_argument('--gaps', type=int, default=250)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    print(f"{'mode':<10}{'rows':>10}{'mean us':>12}{'p99 us':>12}")
+    for mode in ('sequence', 'freelist'):
+        for row in run(mode, sizes, args.inserts, args.gaps):
+            print(f"{row['mode']:<10}{row['rows']:>10}{row['mean_us']:>12.1f}{row['p99_us']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Load test of the core API flows with a regression check against a baseline.
+
+Worker threads drive a weighted mix of register, login, account creation,
+deposits, record creation and list reads through the app in-process,
+against a temporary SQLite file or the database in --database-uri.
+
+    python -m app.benchmarks.load --workers 8 --ops 300 --output results.json
+    python -m app.benchmarks.load --save-baseline
+    python -m app.benchmarks.load --baseline app/benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+
+from . import percentile
+
+DEFAULT_MIX = 'register=1,login=2,account=1,deposit=4,record=6,list=10'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+class Worker:
+    def __init__(self, client, number, seed):
+        self.client = client
+        self.number = number
+        self.rng = random.Random(seed)
+        self.counter = 0
+        self.without_account = []
+
+    def _json(self, response):
+        return response.get_json() or {}
+
+    def setup(self):
+        """Create this worker's own user, account and token (untimed)."""
+        self.name = f'load-{self.number}'
+        user_id = self._json(self.client.post('/register', json={'name': self.name, 'password': 'password'}))['id']
+        token = self._json(self.client.post('/login', json={'name': self.name, 'password': 'password'}))['access_token']
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.user_id = user_id
+        self.account_id = self._json(self.client.post(
+            '/accounts', json={'user_id': user_id, 'initial_balance': 1e9}, headers=self.headers
+        ))['id']
+
+    def register(self):
+        self.counter += 1
+        response = self.client.post(
+            '/register', json={'name': f'load-{self.number}-{self.counter}', 'password': 'password'}
+        )
+        if response.status_code == 201:
+            self.without_account.append(self._json(response)['id'])
+        return response
+
+    def login(self):
+        return self.client.post('/login', json={'name': self.name, 'password': 'password'})
+
+    def account(self):
+        if not self.without_account:
+            self.register()
+        user_id = self.without_account.pop()
+        return self.client.post('/accounts', json={'user_id': user_id}, headers=self.headers)
+
+    def deposit(self):
+        return self.client.post(
+            f'/accounts/{self.account_id}/deposit', json={'amount': self.rng.randint(1, 100)}, headers=self.headers
+        )
+
+    def record(self):
+        return self.client.post('/records', json={
+            'user_id': self.user_id, 'category_id': self.rng.randint(1, 10), 'amount': self.rng.randint(1, 50)
+        }, headers=self.headers)
+
+    def list(self):
+        return self.client.get(f'/records?user_id={self.user_id}&limit=50', headers=self.headers)
+
+
+def run(flask_app, workers, ops, mix, seed):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+
+    client = flask_app.test_client()
+    pool = [Worker(client, n, seed + n) for n in range(workers)]
+    for worker in pool:
+        worker.setup()
+
+    def drive(worker):
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        for _ in range(ops):
+            name = worker.rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            response = getattr(worker, name)()
+            local[name].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                local_errors[name] += 1
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=drive, args=(worker,)) for worker in pool]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    for name in names:
+        latencies = samples[name]
+        results[name] = {
+            'count': len(latencies),
+            'errors': errors[name],
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1e3,
+            'p95_ms': percentile(latencies, 95) * 1e3,
+            'p99_ms': percentile(latencies, 99) * 1e3,
+        }
+    total = sum(len(s) for s in samples.values())
+    return {'elapsed_s': elapsed, 'throughput': total / elapsed, 'operations': results}
+
+
+def compare(results, baseline, tolerance):
+    """
+    List operations that regressed against the baseline.
+
+    An operation regresses when its p95 latency grows or its throughput
+    drops by more than ``tolerance`` (a fraction).
+    """
+    regressions = []
+    for name, current in results['operations'].items():
+        previous = baseline['operations'].get(name)
+        if not previous or not current['count']:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.2f} -> {current['p95_ms']:.2f} ms")
+        if current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput']:.0f} -> {current['throughput']:.0f} ops/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=300, help='operations per worker')
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare against this results file')
+    parser.add_argument('--save-baseline', action='store_true', help=f'write results to {DEFAULT_BASELINE}')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        args.database_uri = f'sqlite:///{path}'
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    os.environ.setdefault('HASH_WORKERS', '0')
+    # Measure the app, not the limits: one benchmark client would exhaust its bucket
+    os.environ.setdefault('RATE_LIMIT_PER_SECOND', '0')
+    os.environ.setdefault('MAX_CONCURRENT_REQUESTS', '0')
+
+    from .. import create_app
+    from ..models import db, Category
+
+    flask_app = create_app()
+    with flask_app.app_context():
+        db.create_all()
+        for n in range(10):
+            Category(name=f'category-{n}')
+        db.session.commit()
+
+    mix = {name: int(weight) for name, weight in (part.split('=') for part in args.mix.split(','))}
+    results = run(flask_app, args.workers, args.ops, mix, args.seed)
+    results['meta'] = {
+        'workers': args.workers, 'ops': args.ops, 'mix': args.mix,
+        'database': flask_app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+        'python': platform.python_version(), 'machine': platform.machine(),
+    }
+
+    print(f"{'operation':<10}{'count':>8}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in results['operations'].items():
+        print(f"{name:<10}{row['count']:>8}{row['errors']:>8}{row['throughput']:>10.1f}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+    print(f"total {results['throughput']:.1f} ops/s in {results['elapsed_s']:.2f}s")
+
+    for path in filter(None, [args.output, DEFAULT_BASELINE if args.save_baseline else None]):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Rows/sec of list serialization: ORM objects + marshmallow + jsonify versus
+column tuples + RowSerializer. Also checks the two outputs are identical.
+
+    python -m app.benchmarks.serialization --rows 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    os.environ.setdefault('HASH_WORKERS', '0')
+
+    from flask import jsonify
+    from sqlalchemy import insert
+    from .. import create_app
+    from ..app import records_schema, users_schema, record_rows, user_rows
+    from ..models import db, User, Record
+
+    app = create_app()
+    rng = random.Random(1)
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User.__table__), [
+            {'name': f'користувач-{n}', 'password': 'x'} for n in range(args.rows)
+        ])
+        db.session.execute(insert(Record.__table__), [
+            {
+                'user_id': rng.randint(1, args.rows),
+                'category_id': 1,
+                'amount': rng.choice([rng.random() * 1000, float(rng.randint(1, 100)), 1e16, 0.1]),
+                'date_time': start + timedelta(seconds=rng.randint(0, 10 ** 7), microseconds=rng.randint(0, 999999)),
+            }
+            for _ in range(args.rows)
+        ])
+        db.session.commit()
+
+    cases = [
+        ('record', Record, records_schema, record_rows),
+        ('user', User, users_schema, user_rows),
+    ]
+    print(f"{'model':<8}{'path':<12}{'rows/s':>12}")
+    with app.test_request_context():
+        for name, model, schema, rows in cases:
+            timings = {}
+            outputs = {}
+            for label in ('marshmallow', 'fast'):
+                best = None
+                for _ in range(args.repeat):
+                    began = time.perf_counter()
+                    if label == 'marshmallow':
+                        objects = model.query.order_by(model.id).all()
+                        body = jsonify({'items': schema.dump(objects), 'next': None}).get_data()
+                    else:
+                        tuples = db.session.query(*rows.columns).order_by(model.id).all()
+                        body = rows.encode_page(tuples, None).encode()
+                    elapsed = time.perf_counter() - began
+                    best = elapsed if best is None else min(best, elapsed)
+                    db.session.expunge_all()
+                timings[label] = best
+                outputs[label] = body
+                print(f'{name:<8}{label:<12}{args.rows / best:>12.0f}')
+            if outputs['marshmallow'] != outputs['fast']:
+                raise SystemExit(f'{name}: fast output differs from marshmallow')
+            print(f"{name:<8}{'speedup':<12}{timings['marshmallow'] / timings['fast']:>11.1f}x")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Side-by-side throughput of the sync (WSGI) and async (ASGI) serving modes.
+
+Both modes are driven in-process at the same concurrency against
+GET /records, reporting requests/sec and traced memory per concurrent
+connection.
+
+    python -m app.benchmarks.serving --concurrency 64 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+
+def seed(flask_app, rows):
+    from sqlalchemy import insert
+    from flask_jwt_extended import create_access_token
+    from ..models import db, User, Category, Record
+
+    with flask_app.app_context():
+        db.create_all()
+        User(name='bench', password='bench-password')
+        Category(name='bench')
+        now = datetime.utcnow()
+        db.session.execute(insert(Record.__table__), [
+            {'user_id': 1, 'category_id': 1, 'amount': 1.0, 'date_time': now} for _ in range(rows)
+        ])
+        db.session.commit()
+        return create_access_token(identity=1)
+
+
+def run_sync(flask_app, token, concurrency, total):
+    client = flask_app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    per_worker = total // concurrency
+
+    def worker():
+        for _ in range(per_worker):
+            assert client.get('/records?limit=50', headers=headers).status_code == 200
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_worker * concurrency
+
+
+def run_async(asgi_app, token, concurrency, total):
+    per_worker = total // concurrency
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': '/records', 'query_string': b'limit=50',
+        'headers': [(b'authorization', f'Bearer {token}'.encode())],
+        'http_version': '1.1', 'scheme': 'http', 'root_path': '', 'server': ('bench', 80),
+    }
+
+    async def request():
+        status = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await asgi_app(scope, receive, send)
+        assert status == [200]
+
+    async def worker():
+        for _ in range(per_worker):
+            await request()
+
+    async def main():
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        await asgi_app.dispose()
+
+    asyncio.run(main())
+    return per_worker * concurrency
+
+
+def measure(name, fn, concurrency):
+    tracemalloc.start()
+    start = time.perf_counter()
+    done = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<6}{done / elapsed:>12.0f}{peak / concurrency / 1024:>16.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    if 'SQLALCHEMY_DATABASE_URI' not in os.environ:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    os.environ.setdefault('HASH_WORKERS', '0')
+    # Measure the app, not the limits: one benchmark client would exhaust its bucket
+    os.environ.setdefault('RATE_LIMIT_PER_SECOND', '0')
+    os.environ.setdefault('MAX_CONCURRENT_REQUESTS', '0')
+
+    from ..asgi import app as asgi_app
+    flask_app = asgi_app.flask_app
+
+    token = seed(flask_app, args.rows)
+    print(f"{'mode':<6}{'req/s':>12}{'KiB/conn':>16}")
+    measure('sync', lambda: run_sync(flask_app, token, args.concurrency, args.requests), args.concurrency)
+    measure('async', lambda: run_async(asgi_app, token, args.concurrency, args.requests), args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Cold start and per-worker memory of the WSGI app.
+
+Every measurement runs in a fresh interpreter. The cold start reports the
+time to import the package, build the app with create_app() and serve the
+first request (GET /users/1, which reads the database). The pre-fork run
+starts --workers children the way gunicorn does, once with the app built
+in the parent before forking (preload_app) and once with every worker
+building its own. It reports time to first request and RSS/PSS per worker.
+PSS divides shared pages between the processes sharing them, so it shows
+what preloading saves.
+
+    python -m app.benchmarks.startup --runs 5 --workers 4
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs in the child interpreter; nothing from the app is imported before the clock starts
+CHILD = r'''
+import json, os, sys, time
+
+def memory():
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line and not line.startswith(' '))
+        return {k.lower(): int(fields[k].split()[0]) / 1024 for k in ('Rss', 'Pss')}
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'rss': rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 'pss': None}
+
+def first_request(app):
+    status = app.test_client().get('/users/1').status_code
+    assert status in (200, 404), status
+
+mode, workers = sys.argv[1], int(sys.argv[2])
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+
+if mode == 'cold':
+    app = create_app()
+    created = time.perf_counter()
+    first_request(app)
+    done = time.perf_counter()
+    print(json.dumps(dict(memory(), import_ms=(imported - start) * 1e3,
+                          create_ms=(created - imported) * 1e3, request_ms=(done - created) * 1e3)))
+    sys.exit()
+
+app = create_app() if mode == 'preload' else None
+if app is not None:
+    first_request(app)  # the master's pool now holds a connection the workers must not share
+read, write = os.pipe()
+forked = time.perf_counter()
+for _ in range(workers):
+    if os.fork() == 0:
+        os.close(read)
+        first_request(app or create_app())
+        line = json.dumps(dict(memory(), request_ms=(time.perf_counter() - forked) * 1e3)) + '\n'
+        os.write(write, line.encode())
+        os._exit(0)
+os.close(write)
+for _ in range(workers):
+    os.wait()
+with os.fdopen(read) as f:
+    sys.stdout.write(f.read())
+'''
+
+
+def run_child(env, mode, workers=0):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, mode, str(workers)],
+        cwd=root, env=env, capture_output=True, text=True, check=True,
+    )
+    return [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    from . import make_app
+    app = make_app(args.database_uri)
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=app.config['SQLALCHEMY_DATABASE_URI'], HASH_WORKERS='0')
+    env.pop('METRICS_DIR', None)
+
+    cold = [run_child(env, 'cold')[0] for _ in range(args.runs)]
+    print(f'cold start (median of {args.runs})')
+    for key, label in (('import_ms', 'import'), ('create_ms', 'create_app'), ('request_ms', 'first request')):
+        print(f'  {label:<14}{statistics.median(r[key] for r in cold):>8.1f} ms')
+    print(f'  {"rss":<14}{statistics.median(r["rss"] for r in cold):>8.1f} MB')
+
+    print(f'\n{args.workers} forked workers  {"first request ms":>16} {"rss MB":>8} {"pss MB":>8}')
+    for mode in ('preload', 'per-worker'):
+        workers = run_child(env, mode, args.workers)
+        pss = [w['pss'] for w in workers if w['pss'] is not None]
+        print(f'  {mode:<16}  {max(w["request_ms"] for w in workers):>16.1f} '
+              f'{statistics.mean(w["rss"] for w in workers):>8.1f} '
+              f'{statistics.mean(pss) if pss else float("nan"):>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Concurrent deposits and withdrawals against a single account.
+
+Checks that the final balance matches the successful operations and was
+never overdrawn, and reports per-operation latency.
+
+    python -m app.benchmarks.withdrawals --workers 8 --ops 200
+"""
+import argparse
+import random
+import threading
+import time
+
+from . import make_app, percentile
+from ..models import db, User, Account
+
+
+def worker(app, seed, ops, results, lock):
+    rng = random.Random(seed)
+    samples, deposited, withdrawn, rejected = [], 0.0, 0.0, 0
+    with app.app_context():
+        for _ in range(ops):
+            amount = float(rng.randint(1, 20))
+            start = time.perf_counter()
+            try:
+                if rng.random() < 0.5:
+                    Account.deposit(1, amount)
+                    deposited += amount
+                else:
+                    Account.withdraw(1, amount)
+                    withdrawn += amount
+                db.session.commit()
+            except ValueError:
+                db.session.rollback()
+                rejected += 1
+            samples.append((time.perf_counter() - start) * 1e3)
+    with lock:
+        results.append((samples, deposited, withdrawn, rejected))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200)
+    parser.add_argument('--initial', type=float, default=100.0)
+    args = parser.parse_args(argv)
+
+    app = make_app(
+        args.database_uri,
+        SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}}
+        if args.database_uri is None else {},
+    )
+    with app.app_context():
+        User(name='bench', password='bench-password')
+        Account(user_id=1, initial_balance=args.initial)
+        db.session.commit()
+
+    results, lock = [], threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(app, seed, args.ops, results, lock))
+        for seed in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = [s for r in results for s in r[0]]
+    deposited = sum(r[1] for r in results)
+    withdrawn = sum(r[2] for r in results)
+    rejected = sum(r[3] for r in results)
+    with app.app_context():
+        balance = db.session.get(Account, 1).balance
+
+    expected = args.initial + deposited - withdrawn
+    print(f'operations   {len(samples)} in {elapsed:.2f}s ({len(samples) / elapsed:.0f} ops/s)')
+    print(f'rejected     {rejected} (insufficient funds)')
+    print(f'p50/p99 ms   {percentile(samples, 50):.2f} / {percentile(samples, 99):.2f}')
+    print(f'balance      {balance:.2f} (expected {expected:.2f})')
+    if abs(balance - expected) > 1e-6 or balance < 0:
+        raise SystemExit('balance mismatch')
+
+
+if __name__ == '__main__':
+    main()
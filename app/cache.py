@@ -0,0 +1,101 @@
+import pickle
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class LocalCache:
+    """In-process LRU cache, private to each worker process."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value, timeout=None):
+        # Bounded by max_entries instead, so entries need no expiry
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._data.get(key, 0) + 1
+            self._data[key] = value
+            self._data.move_to_end(key)
+            return value
+
+
+class RedisCache:
+    """Cache shared by every worker process through Redis."""
+
+    def __init__(self, url, prefix='kpi:', timeout=3600):
+        import redis  # optional, only needed for multi-process deployments
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        if raw is None:
+            return None
+        if raw.isdigit():
+            return int(raw)
+        return pickle.loads(raw)
+
+    def set(self, key, value, timeout=None):
+        """Store a value for ``timeout`` seconds (default: the cache's timeout; 0 keeps it until evicted)."""
+        timeout = self.timeout if timeout is None else timeout
+        self._client.set(self.prefix + key, pickle.dumps(value), ex=timeout or None)
+
+    def incr(self, key):
+        # Counters (namespace versions) never expire: a reset version would serve old entries again
+        return self._client.incr(self.prefix + key)
+
+
+def get_cache():
+    """Return the current app's cache backend, chosen by CACHE_URL."""
+    cache = current_app.extensions.get('cache')
+    if cache is None:
+        url = current_app.config.get('CACHE_URL', 'local://')
+        if url.startswith('redis://'):
+            cache = RedisCache(url, timeout=current_app.config.get('CACHE_TIMEOUT', 3600))
+        else:
+            cache = LocalCache(current_app.config.get('CACHE_MAX_ENTRIES', 1024))
+        current_app.extensions['cache'] = cache
+    return cache
+
+
+def versioned(namespace, key, loader):
+    """
+    Read-through lookup of ``key`` under the current version of ``namespace``.
+
+    Entries of older versions are never read again, so bumping the version
+    with invalidate() drops the whole namespace at once.
+
+    Returns:
+        tuple: (value, version)
+    """
+    cache = get_cache()
+    version = cache.get(f'{namespace}:version') or 0
+    cache_key = f'{namespace}:{version}:{key}'
+    value = cache.get(cache_key)
+    if value is None:
+        value = loader()
+        cache.set(cache_key, value)
+    return value, version
+
+
+def invalidate(namespace):
+    """Bump the namespace version; call after the change is committed."""
+    return get_cache().incr(f'{namespace}:version')
@@ -0,0 +1,146 @@
+"""
+Exercise every endpoint against a throwaway SQLite database and fail if any
+of them exceeds its declared @query_budget or repeats a statement.
+
+    python -m app.check_query_budgets
+"""
+import os
+import sys
+import tempfile
+
+
+def main():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    os.environ['QUERY_BUDGET_MODE'] = 'raise'
+    os.environ.setdefault('HASH_WORKERS', '0')
+    os.environ['RATE_LIMIT_PER_SECOND'] = '0'
+
+    from flask import g, request
+    from . import create_app
+    from .models import db
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+
+    observed = {}
+
+    @app.after_request
+    def record_count(response):
+        # Runs before the budget check, which pops the log
+        if 'query_log' in g:
+            key = (request.method, request.url_rule.rule if request.url_rule else request.path)
+            observed[key] = max(observed.get(key, 0), len(g.query_log))
+        return response
+
+    missing = sorted(
+        name for name, view in app.view_functions.items()
+        if name != 'static' and getattr(view, 'query_budget', None) is None
+    )
+
+    client = app.test_client()
+    failures = []
+
+    def call(method, url, **kwargs):
+        try:
+            return getattr(client, method)(url, **kwargs)
+        except AssertionError as err:
+            failures.append(str(err))
+
+    # Enough rows that an N+1 pattern shows up as repeated statements
+    for n in range(5):
+        call('post', '/register', json={'name': f'user-{n}', 'password': 'password'})
+    token = client.post('/login', json={'name': 'user-0', 'password': 'password'}).get_json()['access_token']
+    auth = {'headers': {'Authorization': f'Bearer {token}'}}
+    for n in range(1, 6):
+        call('post', '/accounts', json={'user_id': n, 'initial_balance': 1000}, **auth)
+    for n in range(3):
+        call('post', '/categories', json={'name': f'category-{n}'}, **auth)
+    for n in range(10):
+        call('post', '/records', json={'user_id': n % 5 + 1, 'category_id': n % 3 + 1, 'amount': 1}, **auth)
+    call('post', '/records/batch', json={'records': [
+        {'user_id': n % 5 + 1, 'category_id': n % 3 + 1, 'amount': 1} for n in range(20)
+    ]}, **auth)
+
+    # A sharded account takes the slot paths of deposits and withdrawals
+    with app.app_context():
+        from .models import Account
+        Account.shard(2, 4)
+        db.session.commit()
+    call('post', '/accounts/2/deposit', json={'amount': 10}, **auth)
+    for n in range(3):
+        call('post', '/records', json={'user_id': 2, 'category_id': 1, 'amount': 400}, **auth)
+    call('post', '/records/batch', json={'records': [
+        {'user_id': 2, 'category_id': 1, 'amount': 1}, {'user_id': 1, 'category_id': 1, 'amount': 1}
+    ]}, **auth)
+
+    for url in ['/users', '/users/1', '/accounts/1', '/accounts/1/balance', '/categories',
+                '/categories/1', '/records', '/records?user_id=1', '/records/1',
+                '/records/export?after_id=1', '/records/export?format=csv',
+                '/summary?user_id=1&category_id=1&month=2000-01',
+                '/reports/spending?bucket=week&group_by=user,category', '/hashing/stats', '/metrics',
+                '/admin/slow-queries']:
+        call('get', url, **auth)
+    call('post', '/accounts/1/deposit', json={'amount': 10}, **auth)
+
+    # Balances and statements read a checkpoint plus the ledger entries after it
+    with app.app_context():
+        from .ledger import checkpoint_ledger
+        checkpoint_ledger(every=2, lag=0)
+    call('post', '/accounts/1/deposit', json={'amount': 10}, **auth)
+    for url in ['/accounts/1/balance?at=2100-01-01T00:00:00', '/accounts/2/statement',
+                '/accounts/1/statement?from=2000-01-01T00:00:00&to=2100-01-01T00:00:00&limit=1']:
+        call('get', url, **auth)
+
+    # Archived records are read and purged by the same statements as hot ones
+    with app.app_context():
+        from datetime import datetime
+        from .archive import archive_records
+        archive_records(datetime.utcnow())
+    for n in range(1, 6):
+        call('post', '/records', json={'user_id': n, 'category_id': n % 3 + 1, 'amount': 1}, **auth)
+
+    # Purging records of rolled-up days also rewinds the rollup
+    call('post', '/records', json={'user_id': 5, 'category_id': 1, 'amount': 1}, **auth)
+    with app.app_context():
+        from datetime import timedelta
+        from sqlalchemy import update
+        from .models import Record
+        from .reports import refresh_rollup
+        db.session.execute(update(Record).where(Record.user_id == 5).values(date_time=datetime.utcnow() - timedelta(days=2)))
+        db.session.commit()
+        refresh_rollup()
+    for url in ['/records', '/records?user_id=1', '/records/1', '/records/export?after_id=1',
+                '/reports/spending?bucket=week&group_by=user,category']:
+        call('get', url, **auth)
+    call('delete', '/categories/3', **auth)
+    call('delete', '/users/5', **auth)
+    call('delete', '/users/4?mode=async', **auth)
+    app.extensions['purge_executor'].shutdown(wait=True)
+    call('get', '/purges/1', **auth)
+
+    # Creating rows again takes their ids from the free list
+    call('post', '/register', json={'name': 'user-5', 'password': 'password'})
+    call('post', '/register', json={'name': 'user-4', 'password': 'password'})
+    call('post', '/accounts', json={'user_id': 5, 'initial_balance': 1000}, **auth)
+    call('post', '/categories', json={'name': 'category-3'}, **auth)
+    call('post', '/records', json={'user_id': 5, 'category_id': 3, 'amount': 1}, **auth)
+    call('post', '/records/batch', json={'records': [
+        {'user_id': 5, 'category_id': 3, 'amount': 1}, {'user_id': 1, 'category_id': 1, 'amount': 1}
+    ]}, **auth)
+
+    for (method, rule), count in sorted(observed.items(), key=lambda item: item[0][1]):
+        print(f'{method:<7}{rule:<32}{count:>4}')
+    for name in missing:
+        failures.append(f'{name} has no @query_budget')
+    for failure in failures:
+        print(f'FAIL {failure}')
+    os.remove(path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
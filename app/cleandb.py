@@ -1,21 +1,27 @@
-import psycopg2
+"""
+Empty the application tables of the configured database, or restore a snapshot.
 
-conn = psycopg2.connect(
-    dbname="KPILAB3",
-    user="postgres",
-    password="aika1711",
-    host="localhost"
-)
-conn.autocommit = True
+    python -m app.cleandb
+    python -m app.cleandb --restore seeded
+"""
+import argparse
 
-with conn.cursor() as cur:
-    cur.execute("""
-        DO $$ DECLARE
-            r RECORD;
-        BEGIN
-            FOR r IN (SELECT tablename FROM pg_tables WHERE schemaname = 'public') LOOP
-                EXECUTE 'TRUNCATE TABLE ' || quote_ident(r.tablename) || ' CASCADE';
-            END LOOP;
-        END $$;
-    """)
-conn.close()
\ No newline at end of file
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--restore', metavar='NAME',
+                        help='restore snapshot NAME (see `flask snapshot`) instead of emptying the tables')
+    args = parser.parse_args()
+
+    from . import create_app
+    from .fixtures import reset, restore
+
+    with create_app().app_context():
+        if args.restore:
+            restore(args.restore)
+        else:
+            reset()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+`flask` CLI commands, registered on the app by create_app().
+
+`flask db` (Flask-Migrate) is a lazy group: alembic is only imported when
+a migration command actually runs, not every time the app starts.
+"""
+import os
+import time
+
+import click
+from flask import Blueprint, current_app
+from flask.cli import ScriptInfo
+
+from .models import db, Account
+from .archive import archive_records
+from .ledger import checkpoint_ledger
+from .explain import find_sequential_scans
+from .aggregates import rebuild_spending
+from .hashing import hash_password
+from .replicas import replicate_sqlite
+from .seed import Dataset, load
+from .fixtures import snapshot, restore, reset
+from .reports import refresh_rollup
+
+commands = Blueprint('commands', __name__, cli_group=None)
+
+
+class MigrationsGroup(click.Group):
+    """Stands in for Flask-Migrate's `db` group, importing it only when `flask db` runs."""
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as db_group
+        app = parent.ensure_object(ScriptInfo).load_app()
+        if 'migrate' not in app.extensions:
+            # Next to the package rather than under whatever directory `flask` runs in
+            Migrate(app, db, directory=os.path.join(app.root_path, 'migrations'))
+        # Parsing with the real group also runs its callback (-x/--x-arg)
+        return db_group.make_context(info_name, args, parent=parent, **extra)
+
+
+commands.cli.add_command(MigrationsGroup('db', help='Perform database migrations.'))
+
+@commands.cli.command('check-indexes')
+def check_indexes():
+    """Fail if any hot query is planned as a sequential scan."""
+    offenders = find_sequential_scans()
+    for name, plan in offenders.items():
+        click.echo(f'{name}: sequential scan')
+        for line in plan:
+            click.echo(f'    {line}')
+    if offenders:
+        raise SystemExit(1)
+    click.echo('All hot queries use an index.')
+
+@commands.cli.command('rebuild-aggregates')
+@click.option('--check', is_flag=True, help='Only report drift, do not rewrite the totals.')
+def rebuild_aggregates(check):
+    """Recompute spending totals from records and report drift."""
+    drift = rebuild_spending(check_only=check)
+    for dimension, key, expected, stored in drift:
+        click.echo(f'{dimension} {key}: expected {expected}, stored {stored}')
+    click.echo(f'{len(drift)} aggregate(s) drifted.')
+    if check and drift:
+        raise SystemExit(1)
+
+@commands.cli.command('rollup-spending')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), help='Roll up days before this date (default: today).')
+def rollup_spending(until):
+    """Pre-roll closed days into daily_spending for /reports."""
+    start, end = refresh_rollup(until.date() if until else None)
+    click.echo(f'Rolled up {start or "the beginning"} to {end}.')
+
+@commands.cli.command('seed')
+@click.option('--users', default=1000, show_default=True, help='Users to generate, each with an account.')
+@click.option('--categories', default=12, show_default=True)
+@click.option('--records', default=100000, show_default=True)
+@click.option('--seed', 'seed_value', default=0, show_default=True, help='Same seed, same dataset.')
+@click.option('--days', default=365, show_default=True, help='Records are spread over this many days up to today.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per COPY chunk or executemany call.')
+@click.option('--password', default='password', show_default=True, help='Password of every generated user.')
+def seed(users, categories, records, seed_value, days, batch_size, password):
+    """Generate a synthetic dataset and bulk load it (COPY on Postgres, executemany on SQLite)."""
+    def report(table, rows, seconds):
+        click.echo(f'{table:<10}{rows:>10} rows {seconds:>9.2f}s {rows / max(seconds, 1e-9):>12.0f} rows/s')
+
+    dataset = Dataset(users, categories, records, seed=seed_value, days=days)
+    stats = load(dataset, hash_password(password), batch_size, report)
+    rows = sum(count for _, count, _ in stats)
+    seconds = sum(elapsed for _, _, elapsed in stats)
+    report('total', rows, seconds)
+
+    started = time.perf_counter()
+    rebuild_spending()
+    click.echo(f'Spending totals rebuilt in {time.perf_counter() - started:.2f}s.')
+
+@commands.cli.command('shard-account')
+@click.argument('account_id', type=int)
+@click.argument('slots', type=int)
+def shard_account(account_id, slots):
+    """Spread ACCOUNT_ID's balance over SLOTS rows (below 2 merges it back)."""
+    account = Account.shard(account_id, slots)
+    if account is None:
+        raise click.ClickException(f'Account {account_id} not found')
+    db.session.commit()
+    click.echo(f'Account {account_id}: {account.slots} slot(s), balance {account.total_balance}.')
+
+@commands.cli.command('replicate')
+@click.option('--interval', default=1.0, show_default=True, help='Seconds between copies; 0 copies once.')
+def replicate(interval):
+    """Keep SQLite replica files in sync with the primary (local testing of READ_REPLICA_URIS)."""
+    primary = db.engine.url.database
+    targets = [db.engines[key].url.database for key in current_app.extensions['replicas'].keys]
+    if db.engine.dialect.name != 'sqlite' or not targets:
+        raise click.ClickException('Needs a SQLite primary and SQLite READ_REPLICA_URIS')
+    while True:
+        replicate_sqlite(primary, targets)
+        if not interval:
+            break
+        time.sleep(interval)
+
+@commands.cli.command('snapshot')
+@click.argument('name')
+def snapshot_db(name):
+    """Save the database as snapshot NAME (SQLite file copy or Postgres template)."""
+    snapshot(name)
+    click.echo(f'Saved snapshot {name}.')
+
+@commands.cli.command('restore')
+@click.argument('name')
+def restore_db(name):
+    """Bring the database back to snapshot NAME."""
+    started = time.perf_counter()
+    restore(name)
+    click.echo(f'Restored snapshot {name} in {time.perf_counter() - started:.3f}s.')
+
+@commands.cli.command('reset-db')
+def reset_db():
+    """Empty every application table."""
+    reset()
+    click.echo('All tables emptied.')
+
+@commands.cli.command('checkpoint-ledger')
+@click.option('--every', type=int, default=None, help='Ledger entries between checkpoints (default: LEDGER_CHECKPOINT_EVERY).')
+def write_ledger_checkpoints(every):
+    """Store balance checkpoints for accounts with new ledger entries."""
+    started = time.perf_counter()
+    written = checkpoint_ledger(every)
+    click.echo(f'Wrote {written} checkpoint(s) in {time.perf_counter() - started:.2f}s.')
+
+@commands.cli.command('archive-records')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), help='Archive records older than this date (default: ARCHIVE_AFTER_DAYS ago).')
+def archive_old_records(before):
+    """Move old records to record_archive, one manifest partition per month."""
+    def report(month, moved):
+        click.echo(f'{month:%Y-%m}{moved:>10} records')
+
+    started = time.perf_counter()
+    total = archive_records(before, report)
+    click.echo(f'Archived {total} record(s) in {time.perf_counter() - started:.2f}s.')
+
+@commands.cli.command('slow-queries')
+@click.option('--limit', default=20, show_default=True, help='Number of fingerprints to show.')
+@click.option('--plans/--no-plans', default=True, help='Show the captured plans.')
+def slow_queries(limit, plans):
+    """Show the statement fingerprints with the most total time (merged from METRICS_DIR)."""
+    rows = current_app.extensions['slow_queries'].report(limit)
+    if not rows:
+        click.echo('No statements logged; set METRICS_DIR so the web workers share their logs.')
+        return
+    click.echo(f"{'total ms':>12}{'calls':>9}{'slow':>7}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}  fingerprint")
+    for row in rows:
+        click.echo(f"{row['total_ms']:>12.1f}{row['calls']:>9}{row['slow_calls']:>7}{row['mean_ms']:>10.2f}"
+                   f"{row['p95_ms']:>10.2f}{row['max_ms']:>10.2f}  {row['fingerprint']}")
+        if plans and row['plan']:
+            click.echo(f"    plan captured {row['plan_at']} after {row['plan_ms']:.1f} ms:")
+            for line in row['plan']:
+                click.echo(f'      {line}')
@@ -0,0 +1,94 @@
+from sqlalchemy import select, text
+
+from .models import db, User, Account, Record
+
+# Statements on request hot paths that must be served from an index
+HOT_QUERIES = {
+    'user by name': select(User).where(User.name == 'name'),
+    'account by user': select(Account).where(Account.user_id == 1),
+    'records by user': (
+        select(Record).where(Record.user_id == 1)
+        .order_by(Record.date_time, Record.id).limit(50)
+    ),
+    'records by category': (
+        select(Record).where(Record.category_id == 1)
+        .order_by(Record.date_time, Record.id).limit(50)
+    ),
+    'records page': select(Record).order_by(Record.date_time, Record.id).limit(50),
+}
+
+
+def explain(stmt):
+    """
+    Return the query plan of a statement as a list of lines.
+
+    Uses EXPLAIN on Postgres and EXPLAIN QUERY PLAN on SQLite.
+    """
+    dialect = db.engine.dialect
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        return [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+    return [row[0] for row in db.session.execute(text('EXPLAIN ' + sql))]
+
+
+def explain_sql(engine, statement, parameters=None, analyze=False):
+    """
+    Return the plan of a raw SQL statement as a list of lines, on a connection of its own.
+
+    With ``analyze`` Postgres runs plain SELECTs with EXPLAIN (ANALYZE, BUFFERS);
+    that executes them, so it is skipped for writes and locking reads, and
+    the transaction is rolled back either way.
+    """
+    with engine.connect().execution_options(slow_query_log=False) as connection:
+        return _plan(connection, statement, parameters, analyze)
+
+
+async def explain_sql_async(engine, statement, parameters=None, analyze=False):
+    """explain_sql for an AsyncEngine, which can only connect on its own event loop."""
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(slow_query_log=False)
+        return await connection.run_sync(_plan, statement, parameters, analyze)
+
+
+def _plan(connection, statement, parameters, analyze):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif analyze and statement.lstrip()[:6].upper() == 'SELECT' and 'FOR UPDATE' not in statement.upper():
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) '
+    else:
+        prefix = 'EXPLAIN '
+    rows = connection.exec_driver_sql(prefix + statement, parameters or ())
+    return [row[-1] if dialect == 'sqlite' else row[0] for row in rows]
+
+
+def is_sequential_scan(line):
+    line = line.strip()
+    if 'Seq Scan' in line:
+        return True
+    # SQLite reports a full table walk as "SCAN <table>" without an index
+    return line.startswith('SCAN ') and ' USING ' not in line
+
+
+def find_sequential_scans():
+    """
+    Explain every hot query and collect those planned as a sequential scan.
+
+    On Postgres sequential scans are disabled for the check, so small
+    tables report whether an index *can* serve the query rather than
+    which plan is cheapest today.
+
+    Returns:
+        dict: Query name -> plan lines, for each offending query
+    """
+    offenders = {}
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+    try:
+        for name, stmt in HOT_QUERIES.items():
+            plan = explain(stmt)
+            if any(is_sequential_scan(line) for line in plan):
+                offenders[name] = plan
+    finally:
+        db.session.rollback()
+    return offenders
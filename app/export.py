@@ -0,0 +1,56 @@
+"""
+Streaming record exports.
+
+Rows come from a server-side cursor in ``yield_per`` batches and are
+written out in chunks as they arrive, so memory use does not depend on the
+size of the export.
+"""
+import csv
+import io
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+CSV_COLUMNS = ('id', 'user_id', 'category_id', 'amount', 'date_time')
+
+
+def ndjson_lines(rows, serializer):
+    for row in rows:
+        yield serializer.encode_row(row) + '\n'
+
+
+def csv_lines(rows, serializer):
+    """CSV with the JSON export's value formatting (float repr, ISO dates)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(CSV_COLUMNS)
+    positions = [[c.key for c in serializer.columns].index(name) for name in CSV_COLUMNS]
+    for row in rows:
+        writer.writerow([
+            row[i].isoformat() if hasattr(row[i], 'isoformat') else row[i] for i in positions
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def chunked(lines, size=CHUNK_SIZE):
+    """Group text lines into encoded chunks of roughly ``size`` bytes."""
+    parts, length = [], 0
+    for line in lines:
+        parts.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(parts).encode()
+            parts, length = [], 0
+    if parts:
+        yield ''.join(parts).encode()
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
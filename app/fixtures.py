@@ -0,0 +1,167 @@
+"""
+Database state for tests and benchmarks.
+
+rolled_back() runs a block inside a transaction that is always rolled
+back, so a test leaves nothing behind. snapshot() and restore() save and
+bring back a whole pre-seeded database (a SQLite file copy or a Postgres
+template database). reset() empties every application table.
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+
+from flask_sqlalchemy.session import Session
+
+from .models import db
+
+
+class ConnectionSession(Session):
+    """Session pinned to the connection it was given, instead of the app's engines."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return bind if bind is not None else self.bind
+
+
+@contextmanager
+def rolled_back():
+    """
+    Bind db.session to one connection whose outer transaction is rolled back on exit.
+
+    Code inside the block may commit as usual: with
+    join_transaction_mode='create_savepoint' a commit only releases a
+    SAVEPOINT, and the rollback at the end discards everything.
+
+    Yields:
+        Connection: the connection holding the outer transaction
+    """
+    engine = db.engine
+    session = db.session
+    with engine.connect() as connection:
+        driver = connection.connection.driver_connection
+        isolation_level = getattr(driver, 'isolation_level', None)
+        if engine.dialect.name == 'sqlite':
+            # pysqlite defers BEGIN on its own, which breaks SAVEPOINT; emit it ourselves
+            driver.isolation_level = None
+            event.listen(connection, 'begin', lambda conn: conn.exec_driver_sql('BEGIN'))
+        transaction = connection.begin()
+        db.session = db._make_scoped_session({
+            'class_': ConnectionSession,
+            'bind': connection,
+            'join_transaction_mode': 'create_savepoint',
+        })
+        try:
+            yield connection
+        finally:
+            db.session.remove()
+            db.session = session
+            transaction.rollback()
+            if engine.dialect.name == 'sqlite':
+                driver.isolation_level = isolation_level
+
+
+def _sqlite_path(url):
+    if not url.database or url.database == ':memory:':
+        raise ValueError('Snapshots need a file-backed SQLite database')
+    return url.database
+
+
+def _snapshot_path(url, name):
+    return f'{_sqlite_path(url)}.{name}.snapshot'
+
+
+def copy_sqlite(source, target):
+    """Copy one SQLite database file over another."""
+    # The backup API copies pages consistently even with other connections open
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+@contextmanager
+def _maintenance(url):
+    """Autocommit connection to the Postgres maintenance database, for CREATE/DROP DATABASE."""
+    engine = create_engine(url.set(database='postgres'), isolation_level='AUTOCOMMIT')
+    try:
+        with engine.connect() as connection:
+            yield connection
+    finally:
+        engine.dispose()
+
+
+def _clone_database(connection, source, target):
+    """Replace database ``target`` with a copy of ``source`` (CREATE DATABASE ... TEMPLATE)."""
+    quote = connection.dialect.identifier_preparer.quote
+    # TEMPLATE needs the source to have no other sessions, and DROP the target
+    connection.execute(text(
+        'SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+        'WHERE datname IN (:source, :target) AND pid <> pg_backend_pid()'
+    ), {'source': source, 'target': target})
+    connection.execute(text(f'DROP DATABASE IF EXISTS {quote(target)}'))
+    connection.execute(text(f'CREATE DATABASE {quote(target)} TEMPLATE {quote(source)}'))
+
+
+def snapshot(name):
+    """
+    Save the current database as snapshot ``name``, replacing an older one.
+
+    SQLite copies the file next to the database. Postgres creates a database
+    '<database>_<name>' from the current one as a template.
+    """
+    url = make_url(str(db.engine.url))
+    db.session.remove()
+    db.engine.dispose()
+    if url.get_backend_name() == 'sqlite':
+        copy_sqlite(_sqlite_path(url), _snapshot_path(url, name))
+        return
+    with _maintenance(url) as connection:
+        _clone_database(connection, url.database, f'{url.database}_{name}')
+
+
+def restore(name):
+    """
+    Bring the database back to snapshot ``name``.
+
+    Every pooled connection is dropped first, so the app reconnects to the
+    restored state on its next query.
+    """
+    url = make_url(str(db.engine.url))
+    db.session.remove()
+    db.engine.dispose()
+    if url.get_backend_name() == 'sqlite':
+        path = _snapshot_path(url, name)
+        if not os.path.exists(path):
+            raise ValueError(f'No snapshot named {name}')
+        copy_sqlite(path, _sqlite_path(url))
+        return
+    with _maintenance(url) as connection:
+        source = f'{url.database}_{name}'
+        exists = connection.execute(
+            text('SELECT 1 FROM pg_database WHERE datname = :name'), {'name': source}
+        ).scalar()
+        if not exists:
+            raise ValueError(f'No snapshot named {name}')
+        _clone_database(connection, source, url.database)
+
+
+def reset():
+    """
+    Empty every application table and restart the id sequences.
+
+    Postgres does it with a single TRUNCATE; alembic_version and any table
+    outside the models are left alone.
+    """
+    tables = db.metadata.sorted_tables
+    if db.engine.dialect.name == 'postgresql':
+        names = ', '.join(db.engine.dialect.identifier_preparer.format_table(table) for table in tables)
+        db.session.execute(text(f'TRUNCATE {names} RESTART IDENTITY CASCADE'))
+    else:
+        for table in reversed(tables):
+            db.session.execute(table.delete())
+        db.session.execute(text('DELETE FROM sqlite_sequence'))
+    db.session.commit()
@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for serving with several worker processes.
+
+    gunicorn -c app/gunicorn.conf.py app.wsgi:app
+
+Set METRICS_DIR so /metrics covers every worker, and CACHE_URL to a Redis
+URL so the caches and read-your-writes tracking are shared between them.
+"""
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(2 * (os.cpu_count() or 1) + 1)))
+threads = int(os.getenv('WEB_THREADS', '1'))
+# Build the app once in the master; workers fork from it instead of importing it again
+preload_app = True
+
+
+def child_exit(server, worker):
+    # The files of a dead worker would otherwise be merged forever, gauges included
+    directory = os.getenv('METRICS_DIR')
+    if directory:
+        from app import metrics, slowlog
+        metrics.mark_process_dead(directory, worker.pid)
+        slowlog.mark_process_dead(directory, worker.pid)
@@ -0,0 +1,142 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from passlib.context import CryptContext
+
+
+class HashingBusy(Exception):
+    """Raised when the password hashing queue is full."""
+
+
+_contexts = {}
+
+
+def _context(rounds):
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(schemes=['pbkdf2_sha256'], pbkdf2_sha256__rounds=rounds)
+    return _contexts[rounds]
+
+
+# Run inside the worker processes, so they must stay module-level
+def _hash(password, rounds):
+    start = time.perf_counter()
+    result = _context(rounds).hash(password)
+    return result, time.perf_counter() - start
+
+
+def _verify(password, password_hash, rounds):
+    start = time.perf_counter()
+    result = _context(rounds).verify_and_update(password, password_hash)
+    return result, time.perf_counter() - start
+
+
+class HashPool:
+    """
+    Runs password hashing on a dedicated process pool.
+
+    At most ``workers`` hashes run at once and ``queue_size`` more may wait;
+    anything beyond that is rejected immediately with HashingBusy instead of
+    pinning request threads. With ``workers=0`` hashing runs inline.
+    """
+
+    def __init__(self, workers, queue_size, rounds):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.rounds = rounds
+        self._slots = threading.BoundedSemaphore(max(1, workers) + queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.hash_seconds = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy('Password hashing queue is full')
+
+        with self._lock:
+            self.pending += 1
+        try:
+            if self.workers == 0:
+                result, elapsed = fn(*args)
+            else:
+                result, elapsed = self._get_executor().submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+        with self._lock:
+            self.completed += 1
+            self.hash_seconds += elapsed
+        return result
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password, password_hash):
+        """
+        Check a password against its hash.
+
+        Returns:
+            tuple: (valid, new_hash) - new_hash is set when the stored hash
+            uses outdated cost parameters and should be replaced
+        """
+        return self._run(_verify, password, password_hash, self.rounds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                # Jobs waiting for a worker; inline hashes never wait
+                'queue_depth': max(0, self.pending - self.workers) if self.workers else 0,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'hash_seconds_total': self.hash_seconds,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the current app's hash pool, creating it on first use."""
+    pool = current_app.extensions.get('hash_pool')
+    if pool is None:
+        # Two first requests must not each build a pool with its own slots
+        with _pool_lock:
+            pool = current_app.extensions.get('hash_pool')
+            if pool is None:
+                pool = HashPool(
+                    workers=current_app.config.get('HASH_WORKERS', 0),
+                    queue_size=current_app.config.get('HASH_QUEUE_SIZE', 16),
+                    rounds=current_app.config.get('HASH_ROUNDS', 29000),
+                )
+                current_app.extensions['hash_pool'] = pool
+    return pool
+
+
+def hash_password(password):
+    return get_pool().hash(password)
+
+
+def verify_password(password, password_hash):
+    return get_pool().verify(password, password_hash)
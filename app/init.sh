@@ -9,9 +9,6 @@ echo "Database is ready!"
 
 
 
-rm -rf migrations/
-sleep 5
-flask db init
-flask db migrate -m "Initial migration"
+# The schema comes from the migrations in app/migrations
 flask db upgrade
 flask run --host=0.0.0.0
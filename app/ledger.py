@@ -0,0 +1,148 @@
+"""
+Account ledger.
+
+Every money movement appends a ledger_entry row: the opening balance of
+an account, each deposit and each withdrawal paid for a record. Nothing
+updates or deletes them (except purging the account itself), so the
+balance at any moment can be derived from them. Account.balance stays the
+cheap current balance that deposits and withdrawals check against.
+
+`flask checkpoint-ledger`, run periodically like `flask rollup-spending`,
+writes a balance_checkpoint every LEDGER_CHECKPOINT_EVERY entries of an
+account and one at its newest entry. A balance at time T is then the
+newest checkpoint before T, found with one index seek, plus the entries
+between it and T: fewer than LEDGER_CHECKPOINT_EVERY, or whatever arrived
+since the last run. Statements for a period cost two such lookups plus
+one keyset page of entries.
+
+Entries are ordered by (created_at, id). Checkpoints leave out entries
+younger than LEDGER_CHECKPOINT_LAG seconds, so a transaction that commits
+late cannot add an entry behind an existing checkpoint.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, insert, or_, select, tuple_
+
+from .models import db, LedgerEntry, BalanceCheckpoint
+from .pagination import keyset_filter, finish_page
+
+ORDER = [LedgerEntry.created_at, LedgerEntry.id]
+
+
+def checkpoint_query(account_id, before=None):
+    """Newest checkpoint of an account, only counting those taken before ``before`` if given."""
+    stmt = (
+        select(BalanceCheckpoint)
+        .where(BalanceCheckpoint.account_id == account_id)
+        .order_by(BalanceCheckpoint.created_at.desc(), BalanceCheckpoint.entry_id.desc())
+        .limit(1)
+    )
+    if before is not None:
+        stmt = stmt.where(BalanceCheckpoint.created_at < before)
+    return stmt
+
+
+def delta_query(account_id, checkpoint, at=None):
+    """Sum of the entries made after ``checkpoint`` (None: all of them) and before ``at``."""
+    stmt = select(func.coalesce(func.sum(LedgerEntry.amount), 0.0)).where(LedgerEntry.account_id == account_id)
+    if checkpoint is not None:
+        stmt = stmt.where(tuple_(*ORDER) > tuple_(checkpoint.created_at, checkpoint.entry_id))
+    if at is not None:
+        stmt = stmt.where(LedgerEntry.created_at < at)
+    return stmt
+
+
+def balance_at(account_id, at=None):
+    """
+    Balance of an account from the ledger, one checkpoint plus the entries since.
+
+    Args:
+        account_id: Account id
+        at: Only entries made before this datetime count (default: all)
+
+    Returns:
+        float: the balance, 0.0 before the first entry
+    """
+    checkpoint = db.session.scalars(checkpoint_query(account_id, at)).first()
+    delta = db.session.scalar(delta_query(account_id, checkpoint, at))
+    return (checkpoint.balance if checkpoint else 0.0) + delta
+
+
+def statement(account_id, date_from=None, date_to=None, limit=50, cursor=None):
+    """
+    Opening and closing balance of a period and one page of its entries.
+
+    Args:
+        account_id: Account id
+        date_from: Start of the period (default: the first entry)
+        date_to: End of the period, exclusive (default: now)
+        limit: Entries per page
+        cursor: Cursor of the next page from a previous call
+
+    Returns:
+        tuple: (opening balance, closing balance, entries, next cursor)
+    """
+    opening = balance_at(account_id, date_from) if date_from is not None else 0.0
+    closing = balance_at(account_id, date_to)
+    stmt = select(LedgerEntry).where(LedgerEntry.account_id == account_id)
+    if date_from is not None:
+        stmt = stmt.where(LedgerEntry.created_at >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(LedgerEntry.created_at < date_to)
+    entries = db.session.scalars(keyset_filter(stmt, ORDER, limit, cursor)).all()
+    entries, next_cursor = finish_page(entries, ORDER, limit)
+    return opening, closing, entries, next_cursor
+
+
+def checkpoint_ledger(every=None, lag=None):
+    """
+    Write the checkpoints of every account with entries since its last one.
+
+    One INSERT ... SELECT: a running sum over each account's new entries,
+    started from its newest checkpoint, keeps every ``every``-th row and
+    the last one. Commits.
+
+    Args:
+        every: Entries between checkpoints (default: LEDGER_CHECKPOINT_EVERY)
+        lag: Seconds an entry must have existed to be covered (default: LEDGER_CHECKPOINT_LAG)
+
+    Returns:
+        int: number of checkpoints written
+    """
+    every = every or current_app.config.get('LEDGER_CHECKPOINT_EVERY', 100)
+    if lag is None:
+        lag = current_app.config.get('LEDGER_CHECKPOINT_LAG', 60)
+    cutoff = datetime.utcnow() - timedelta(seconds=lag)
+
+    newest = select(
+        BalanceCheckpoint.account_id, BalanceCheckpoint.created_at, BalanceCheckpoint.entry_id, BalanceCheckpoint.balance,
+        func.row_number().over(
+            partition_by=BalanceCheckpoint.account_id,
+            order_by=(BalanceCheckpoint.created_at.desc(), BalanceCheckpoint.entry_id.desc())
+        ).label('rank')
+    ).subquery()
+    last = select(newest).where(newest.c.rank == 1).subquery('last')
+
+    window = {'partition_by': LedgerEntry.account_id, 'order_by': ORDER}
+    pending = (
+        select(
+            LedgerEntry.account_id, LedgerEntry.id, LedgerEntry.created_at,
+            (func.coalesce(last.c.balance, 0.0) + func.sum(LedgerEntry.amount).over(**window)).label('balance'),
+            func.row_number().over(**window).label('position'),
+            func.count().over(partition_by=LedgerEntry.account_id).label('pending'),
+        )
+        .outerjoin(last, last.c.account_id == LedgerEntry.account_id)
+        .where(
+            LedgerEntry.created_at < cutoff,
+            or_(last.c.account_id.is_(None), tuple_(*ORDER) > tuple_(last.c.created_at, last.c.entry_id)),
+        )
+    ).subquery('pending')
+
+    result = db.session.execute(insert(BalanceCheckpoint).from_select(
+        ['account_id', 'entry_id', 'created_at', 'balance'],
+        select(pending.c.account_id, pending.c.id, pending.c.created_at, pending.c.balance)
+        .where(or_(pending.c.position % every == 0, pending.c.position == pending.c.pending))
+    ))
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,254 @@
+"""
+Prometheus text-format metrics: per-route latency, status codes, SQL
+statement counts and time, and connection-pool checkout waits.
+
+With METRICS_DIR set, every worker process periodically writes its
+snapshot there and /metrics merges all of them, so the numbers cover the
+whole deployment rather than the process that happened to serve the scrape.
+When a worker exits, mark_process_dead() (gunicorn's child_exit hook)
+folds its counters and histograms into metrics-archive.json and drops its
+gauges, which only describe live processes.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms for one process."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, labels, value=1):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, labels, value):
+        key = self._key(name, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                # per-bucket counts (last one is +Inf), then sum and count
+                hist = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            hist[index] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'counters': [[n, dict(l), v] for (n, l), v in self.counters.items()],
+                'gauges': [[n, dict(l), v] for (n, l), v in self.gauges.items()],
+                'histograms': [[n, dict(l), list(h)] for (n, l), h in self.histograms.items()],
+            }
+
+
+def merge(snapshots):
+    """Sum snapshots from several processes into one."""
+    merged = {'buckets': list(DEFAULT_BUCKETS), 'counters': {}, 'gauges': {}, 'histograms': {}}
+    for snapshot in snapshots:
+        merged['buckets'] = snapshot['buckets']
+        for kind in ('counters', 'gauges'):
+            for name, labels, value in snapshot[kind]:
+                key = Metrics._key(name, labels)
+                merged[kind][key] = merged[kind].get(key, 0) + value
+        for name, labels, hist in snapshot['histograms']:
+            key = Metrics._key(name, labels)
+            current = merged['histograms'].get(key)
+            merged['histograms'][key] = hist if current is None else [a + b for a, b in zip(current, hist)]
+    return merged
+
+
+def mark_process_dead(directory, pid):
+    """
+    Retire the snapshot file of an exited process.
+
+    Its counters and histograms are added to metrics-archive.json, so
+    deployment totals never go backwards; its gauges (queue depths, pool
+    sizes) are dropped rather than summed with those of live processes.
+    """
+    path = os.path.join(directory, f'metrics-{pid}.json')
+    if not os.path.exists(path):
+        return
+    archive = os.path.join(directory, 'metrics-archive.json')
+    snapshots = []
+    for source in (archive, path):
+        if os.path.exists(source):
+            with open(source) as f:
+                snapshots.append(json.load(f))
+    merged = merge(snapshots)
+    tmp = archive + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({
+            'buckets': merged['buckets'],
+            'counters': [[n, dict(l), v] for (n, l), v in merged['counters'].items()],
+            'gauges': [],
+            'histograms': [[n, dict(l), h] for (n, l), h in merged['histograms'].items()],
+        }, f)
+    os.replace(tmp, archive)
+    os.remove(path)
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+
+def render(merged):
+    """Render a merged snapshot in the Prometheus text exposition format."""
+    lines = []
+    for kind, type_name in (('counters', 'counter'), ('gauges', 'gauge')):
+        seen = set()
+        for (name, labels), value in sorted(merged[kind].items()):
+            if name not in seen:
+                lines.append(f'# TYPE {name} {type_name}')
+                seen.add(name)
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    bounds = [str(b) for b in merged['buckets']] + ['+Inf']
+    seen = set()
+    for (name, labels), hist in sorted(merged['histograms'].items()):
+        if name not in seen:
+            lines.append(f'# TYPE {name} histogram')
+            seen.add(name)
+        cumulative = 0
+        for bound, count in zip(bounds, hist[:-2]):
+            cumulative += count
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {hist[-2]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {hist[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class Instrumentation:
+    """Hooks metrics collection into a Flask app and its SQLAlchemy engine."""
+
+    def __init__(self, app, db):
+        self.metrics = Metrics()
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5.0)
+        self._last_flush = 0.0
+        self.collectors = []
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        with app.app_context():
+            self.instrument_engine(db.engine)
+        app.extensions['metrics'] = self
+
+    # Request hooks
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.db_statements = 0
+        g.db_time = 0.0
+
+    def _after_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = {'endpoint': endpoint, 'method': request.method}
+        self.metrics.observe('http_request_duration_seconds', labels, time.perf_counter() - start)
+        self.metrics.inc('http_requests_total', dict(labels, status=response.status_code))
+        self.metrics.inc('db_statements_total', labels, g.db_statements)
+        self.metrics.observe('db_request_duration_seconds', labels, g.db_time)
+        self._maybe_flush()
+        return response
+
+    # Engine hooks
+    def instrument_engine(self, engine):
+        """Count statements, database time and pool checkout waits of an engine."""
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+            if has_request_context() and 'db_statements' in g:
+                g.db_statements += 1
+                g.db_time += elapsed
+
+        # The pool has no "before checkout" event, so time the checkout call itself.
+        # dispose() (after a fork, on snapshot restore) swaps in a new pool, so wrap that one too.
+        self._time_checkouts(engine.pool)
+
+        @event.listens_for(engine, 'engine_disposed')
+        def engine_disposed(engine):
+            self._time_checkouts(engine.pool)
+
+    def _time_checkouts(self, pool):
+        connect = pool.connect
+
+        def timed_connect():
+            start = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                self.metrics.observe('db_pool_checkout_seconds', {}, time.perf_counter() - start)
+
+        pool.connect = timed_connect
+
+    # Export
+    def add_collector(self, collector):
+        """Register ``collector(metrics)``, called to refresh gauges before export."""
+        self.collectors.append(collector)
+
+    def _snapshot(self):
+        for collector in self.collectors:
+            collector(self.metrics)
+        return self.metrics.snapshot()
+
+    def _path(self):
+        return os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+
+    def flush(self):
+        """Write this process's snapshot to METRICS_DIR."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(tmp, self._path())
+        self._last_flush = time.monotonic()
+
+    def _maybe_flush(self):
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def collect(self):
+        """Merged snapshot of every process (or just this one without METRICS_DIR)."""
+        if not self.directory:
+            return merge([self._snapshot()])
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        return merge(snapshots)
@@ -0,0 +1,28 @@
+"""Add free_id table for id allocation
+
+Revision ID: 3f1c9a7d2b10
+Revises: 856b26b73cc0
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b10'
+down_revision = '856b26b73cc0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('free_id',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.PrimaryKeyConstraint('table_name', 'id')
+    )
+
+
+def downgrade():
+    op.drop_table('free_id')
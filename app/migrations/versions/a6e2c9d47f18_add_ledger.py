@@ -0,0 +1,59 @@
+"""Add ledger_entry and balance_checkpoint, opening every account's ledger with its balance
+
+Revision ID: a6e2c9d47f18
+Revises: d3a7f5c81b96
+Create Date: 2026-10-18 21:03:29.540117
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e2c9d47f18'
+down_revision = 'd3a7f5c81b96'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ledger_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('ix_ledger_entry_account_id_created_at', 'ledger_entry', ['account_id', 'created_at', 'id'], unique=False)
+
+    op.create_table('balance_checkpoint',
+    sa.Column('account_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('entry_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('balance', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('account_id', 'entry_id')
+    )
+    op.create_index('ix_balance_checkpoint_account_id_created_at', 'balance_checkpoint', ['account_id', 'created_at', 'entry_id'], unique=False)
+
+    # Earlier movements left no trace, so each ledger starts from the current balance
+    op.execute(sa.text(
+        "INSERT INTO ledger_entry (account_id, amount, kind, created_at) "
+        "SELECT id, total, 'open', :now FROM ("
+        "SELECT account.id, account.balance + coalesce((SELECT sum(account_slot.balance) FROM account_slot "
+        "WHERE account_slot.account_id = account.id), 0) AS total FROM account"
+        ") AS opening WHERE total <> 0"
+    ).bindparams(now=datetime.utcnow()))
+
+
+def downgrade():
+    op.drop_index('ix_balance_checkpoint_account_id_created_at', table_name='balance_checkpoint')
+    op.drop_table('balance_checkpoint')
+    op.drop_index('ix_ledger_entry_account_id_created_at', table_name='ledger_entry')
+    op.drop_table('ledger_entry')
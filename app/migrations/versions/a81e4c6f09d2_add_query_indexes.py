@@ -0,0 +1,57 @@
+"""Add indexes for record, account and user lookups
+
+Revision ID: a81e4c6f09d2
+Revises: 3f1c9a7d2b10
+Create Date: 2026-10-18 11:03:54.190288
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a81e4c6f09d2'
+down_revision = '3f1c9a7d2b10'
+branch_labels = None
+depends_on = None
+
+
+# (unique index, table, column) built over data that was never constrained
+UNIQUE_INDEXES = [
+    ('ix_user_name', 'user', 'name'),
+    ('ix_account_user_id', 'account', 'user_id'),
+]
+
+
+def check_duplicates():
+    # Merging duplicate users or accounts means choosing whose records and money
+    # survive, which is not a migration's call: refuse with the values to resolve
+    problems = []
+    for index, table, column in UNIQUE_INDEXES:
+        duplicates = op.get_bind().execute(sa.text(
+            f'SELECT {column}, count(*) FROM "{table}" GROUP BY {column} HAVING count(*) > 1 ORDER BY {column} LIMIT 20'
+        )).all()
+        if duplicates:
+            values = ', '.join(f'{value!r} ({count} rows)' for value, count in duplicates)
+            problems.append(f'{table}.{column} has duplicates, so {index} cannot be unique: {values}')
+    if problems:
+        raise RuntimeError(
+            'Resolve these duplicates, then run the upgrade again:\n' + '\n'.join(problems)
+        )
+
+
+def upgrade():
+    check_duplicates()
+    op.create_index('ix_user_name', 'user', ['name'], unique=True)
+    op.create_index('ix_account_user_id', 'account', ['user_id'], unique=True)
+    op.create_index('ix_record_user_id_date_time', 'record', ['user_id', 'date_time'], unique=False)
+    op.create_index('ix_record_category_id_date_time', 'record', ['category_id', 'date_time'], unique=False)
+    op.create_index('ix_record_date_time', 'record', ['date_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_record_date_time', table_name='record')
+    op.drop_index('ix_record_category_id_date_time', table_name='record')
+    op.drop_index('ix_record_user_id_date_time', table_name='record')
+    op.drop_index('ix_account_user_id', table_name='account')
+    op.drop_index('ix_user_name', table_name='user')
@@ -0,0 +1,37 @@
+"""Recreate the id-allocated tables with AUTOINCREMENT on SQLite
+
+Revision ID: b8f3d6a2e471
+Revises: a6e2c9d47f18
+Create Date: 2026-10-18 22:14:52.318406
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f3d6a2e471'
+down_revision = 'a6e2c9d47f18'
+branch_labels = None
+depends_on = None
+
+# Tables whose released ids go to the free list. Without AUTOINCREMENT SQLite
+# hands the highest deleted id out again, which may still sit in free_id.
+# The models declare sqlite_autoincrement, but only create_all() applied it.
+TABLES = ['user', 'account', 'category', 'record']
+
+
+def recreate(autoincrement):
+    # Postgres sequences never go back, and SQLite cannot alter a table in place
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in TABLES:
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}):
+            pass
+
+
+def upgrade():
+    recreate(True)
+
+
+def downgrade():
+    recreate(False)
@@ -0,0 +1,32 @@
+"""Add account_slot table for sharded account balances
+
+Revision ID: b94e1f7c3a58
+Revises: f2c8d4a7e913
+Create Date: 2026-10-18 18:05:33.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b94e1f7c3a58'
+down_revision = 'f2c8d4a7e913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('account', sa.Column('slots', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('account_slot',
+    sa.Column('account_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('slot', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('balance', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('account_id', 'slot')
+    )
+
+
+def downgrade():
+    op.drop_table('account_slot')
+    op.drop_column('account', 'slots')
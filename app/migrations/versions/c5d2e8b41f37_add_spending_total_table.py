@@ -0,0 +1,31 @@
+"""Add spending_total aggregate table
+
+Revision ID: c5d2e8b41f37
+Revises: a81e4c6f09d2
+Create Date: 2026-10-18 12:20:07.664912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d2e8b41f37'
+down_revision = 'a81e4c6f09d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('spending_total',
+    sa.Column('dimension', sa.String(length=16), nullable=False),
+    sa.Column('key', sa.String(length=32), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('dimension', 'key')
+    )
+    # Existing records are folded in by `flask rebuild-aggregates`
+
+
+def downgrade():
+    op.drop_table('spending_total')
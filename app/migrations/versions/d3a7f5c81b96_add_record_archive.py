@@ -0,0 +1,49 @@
+"""Add record_archive table and its archive_partition manifest
+
+Revision ID: d3a7f5c81b96
+Revises: b94e1f7c3a58
+Create Date: 2026-10-18 19:12:47.215836
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7f5c81b96'
+down_revision = 'b94e1f7c3a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('record_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('date_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_record_archive_user_id_date_time', 'record_archive', ['user_id', 'date_time'], unique=False)
+    op.create_index('ix_record_archive_category_id_date_time', 'record_archive', ['category_id', 'date_time'], unique=False)
+    op.create_index('ix_record_archive_date_time', 'record_archive', ['date_time'], unique=False)
+
+    op.create_table('archive_partition',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('first_date_time', sa.DateTime(), nullable=False),
+    sa.Column('last_date_time', sa.DateTime(), nullable=False),
+    sa.Column('records', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('month')
+    )
+
+
+def downgrade():
+    op.drop_table('archive_partition')
+    op.drop_index('ix_record_archive_date_time', table_name='record_archive')
+    op.drop_index('ix_record_archive_category_id_date_time', table_name='record_archive')
+    op.drop_index('ix_record_archive_user_id_date_time', table_name='record_archive')
+    op.drop_table('record_archive')
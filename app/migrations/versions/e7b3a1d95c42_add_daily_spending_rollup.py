@@ -0,0 +1,39 @@
+"""Add daily_spending rollup and rollup_state tables
+
+Revision ID: e7b3a1d95c42
+Revises: c5d2e8b41f37
+Create Date: 2026-10-18 15:02:41.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3a1d95c42'
+down_revision = 'c5d2e8b41f37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_spending',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('category_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'user_id', 'category_id')
+    )
+    op.create_table('rollup_state',
+    sa.Column('name', sa.String(length=32), nullable=False),
+    sa.Column('rolled_until', sa.Date(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Closed days are rolled up by `flask rollup-spending`
+
+
+def downgrade():
+    op.drop_table('rollup_state')
+    op.drop_table('daily_spending')
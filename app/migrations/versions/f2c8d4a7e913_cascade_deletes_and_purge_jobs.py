@@ -0,0 +1,53 @@
+"""Cascade owner deletes in the database and add purge_job table
+
+Revision ID: f2c8d4a7e913
+Revises: e7b3a1d95c42
+Create Date: 2026-10-18 16:41:09.572310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8d4a7e913'
+down_revision = 'e7b3a1d95c42'
+branch_labels = None
+depends_on = None
+
+# (constraint, table, column, referred table), named as Postgres named the originals
+FOREIGN_KEYS = [
+    ('account_user_id_fkey', 'account', 'user_id', 'user'),
+    ('record_user_id_fkey', 'record', 'user_id', 'user'),
+    ('record_category_id_fkey', 'record', 'category_id', 'category'),
+]
+
+
+def replace_foreign_keys(ondelete):
+    # SQLite only enforces foreign keys with PRAGMA foreign_keys, and the app
+    # deletes children explicitly, so the constraints are only rebuilt on Postgres
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, table, column, referred in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+    op.create_table('purge_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('deleted', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('purge_job')
+    replace_foreign_keys(None)
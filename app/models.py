@@ -1,37 +1,127 @@
+import random
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import select, func
-from passlib.hash import pbkdf2_sha256
+from flask import current_app
+from sqlalchemy.orm import Session, column_property
+from sqlalchemy import select, delete, insert, update, event, func, text, literal, union_all, case
+from .hashing import hash_password
+from .replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-def get_smallest_available_id(model):
+class FreeId(db.Model):
+    """Ids released by deleted rows, handed out again before the sequence."""
+    __tablename__ = 'free_id'
+    table_name = db.Column(db.String(64), primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+def allocate_id(model):
     """
-    Find the smallest available ID for a given model.
-    
+    Allocate an id for a new row of a given model.
+
+    In 'sequence' mode the database sequence assigns the id on flush.
+    In 'freelist' mode the smallest released id is taken from the free
+    list with a single index seek; the row is claimed with SKIP LOCKED so
+    concurrent writers never receive the same id.
+
     Args:
         model: SQLAlchemy model class
-        
+
     Returns:
-        int: Smallest available ID
+        int or None: Reused ID, or None to let the sequence assign one
     """
-    # Get all existing IDs ordered
-    stmt = select(model.id).order_by(model.id)
-    existing_ids = [row[0] for row in db.session.execute(stmt)]
-    
-    if not existing_ids:
-        return 1
-        
-    # Find first gap in sequence
-    smallest_id = 1
-    for current_id in existing_ids:
-        if current_id != smallest_id:
-            return smallest_id
-        smallest_id += 1
-        
-    return smallest_id
+    ids = allocate_ids(model, 1)
+    return ids[0] if ids else None
+
+def allocate_ids(model, count):
+    """
+    Allocate up to ``count`` released ids for a given model in one query.
+
+    Args:
+        model: SQLAlchemy model class
+        count: Number of ids wanted
+
+    Returns:
+        list: Reused IDs, possibly fewer than ``count``; the sequence
+        assigns ids to the remaining rows
+    """
+    if current_app.config.get('ID_ALLOCATION', 'freelist') != 'freelist':
+        return []
+
+    table_name = model.__tablename__
+    stmt = (
+        select(FreeId.id)
+        .where(FreeId.table_name == table_name)
+        .order_by(FreeId.id)
+        .limit(count)
+        .with_for_update(skip_locked=True)
+    )
+    free_ids = db.session.execute(stmt).scalars().all()
+    if free_ids:
+        db.session.execute(
+            delete(FreeId).where(FreeId.table_name == table_name, FreeId.id.in_(free_ids))
+        )
+    return free_ids
+
+def reserve_ids(model, count):
+    """
+    Reserve ``count`` fresh ids from a model's sequence in one query.
+
+    On SQLite the transaction must already have written, which makes it
+    the single writer and keeps the AUTOINCREMENT counter stable until
+    commit; inserting the reserved ids advances the counter past them.
+
+    Args:
+        model: SQLAlchemy model class
+        count: Number of ids wanted
+
+    Returns:
+        list: New IDs
+    """
+    if count <= 0:
+        return []
+    if db.engine.dialect.name == 'postgresql':
+        sequence = func.pg_get_serial_sequence(model.__tablename__, 'id')
+        stmt = select(func.nextval(sequence)).select_from(func.generate_series(1, count))
+        return list(db.session.scalars(stmt))
+    top = db.session.scalar(text(
+        f'SELECT max(coalesce((SELECT seq FROM sqlite_sequence WHERE name = :name), 0), '
+        f'(SELECT coalesce(max(id), 0) FROM "{model.__tablename__}"))'
+    ), {'name': model.__tablename__})
+    start = top + 1
+    return list(range(start, start + count))
+
+def release_ids(connection, released):
+    """Return the ids of deleted rows, as (table_name, id) pairs, to the free list."""
+    if not released or current_app.config.get('ID_ALLOCATION', 'freelist') != 'freelist':
+        return
+    connection.execute(
+        insert(FreeId.__table__), [{'table_name': table_name, 'id': id} for table_name, id in released]
+    )
+
+def release_where(connection, selections):
+    """
+    Return the ids of rows about to be bulk deleted to the free list.
+
+    Args:
+        connection: Connection of the transaction deleting the rows
+        selections: (model, condition) pairs, written with one INSERT ... SELECT
+    """
+    if not selections or current_app.config.get('ID_ALLOCATION', 'freelist') != 'freelist':
+        return
+    released = [
+        select(literal(getattr(model, 'id_table', model.__tablename__)).label('table_name'), model.id).where(condition)
+        for model, condition in selections
+    ]
+    released = union_all(*released) if len(released) > 1 else released[0]
+    connection.execute(insert(FreeId.__table__).from_select(['table_name', 'id'], released))
 
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_name', 'name', unique=True),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     password = db.Column(db.String(256), nullable=False)
@@ -39,11 +129,17 @@ class User(db.Model):
     records = db.relationship('Record', backref='user', lazy=True, cascade="all, delete-orphan")
     
     def __init__(self, name, password):
+        # Hash before allocate_id claims a free id, so no row lock is held while the hash pool works
+        self.password = hash_password(password)
+        self.id = allocate_id(User)
         self.name = name
-        self.password = pbkdf2_sha256.hash(password)
         db.session.add(self)
         db.session.flush()
-        self.id = get_smallest_available_id(User)
+
+    @staticmethod
+    def by_name(name):
+        """Look up a user by name through the unique ix_user_name index"""
+        return User.query.filter(User.name == name).one_or_none()
 
     def to_dict(self):
         return {
@@ -52,52 +148,285 @@ class User(db.Model):
         }
 
 class Account(db.Model):
+    __table_args__ = (
+        db.Index('ix_account_user_id', 'user_id', unique=True),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     balance = db.Column(db.Float, nullable=False, default=0.0)
+    # 0 keeps the whole balance on this row; N > 0 spreads it over N AccountSlot rows
+    slots = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __init__(self, user_id, initial_balance=0.0):
+        self.id = allocate_id(Account)
         self.user_id = user_id
         self.balance = initial_balance
         db.session.add(self)
         db.session.flush()
-        self.id = get_smallest_available_id(Account)
+        if initial_balance:
+            LedgerEntry.append(self.id, initial_balance, 'open')
 
-    def deposit(self, amount):
+    @staticmethod
+    def for_user(user_id):
+        """Look up a user's account through the unique ix_account_user_id index"""
+        return Account.query.filter(Account.user_id == user_id).one_or_none()
+
+    @staticmethod
+    def deposit(account_id, amount):
+        """
+        Adds the amount to an account balance in a single UPDATE ... RETURNING
+
+        Sharded accounts credit one random slot instead, so concurrent
+        deposits do not queue on the account row. Either way the deposit is
+        appended to the ledger.
+
+        Returns:
+            Account or None if the account does not exist
+        """
         if amount <= 0:
             raise ValueError("Amount must be positive")
-        self.balance += amount
-        self.updated_at = datetime.utcnow()
+        stmt = (
+            update(Account)
+            .where(Account.id == account_id, Account.slots == 0)
+            .values(balance=Account.balance + amount, updated_at=datetime.utcnow())
+            .returning(Account)
+        )
+        account = db.session.scalars(stmt).one_or_none()
+        if account is not None:
+            LedgerEntry.append(account_id, amount, 'deposit')
+            return account
+
+        result = db.session.execute(
+            update(AccountSlot)
+            .where(AccountSlot.account_id == account_id, AccountSlot.slot == Account.random_slot(account_id))
+            .values(balance=AccountSlot.balance + amount),
+            execution_options={'synchronize_session': False}
+        )
+        if result.rowcount == 0:
+            return None
+        LedgerEntry.append(account_id, amount, 'deposit')
+        return db.session.get(Account, account_id, populate_existing=True)
+
+    @staticmethod
+    def withdraw(user_id, amount):
+        """
+        Withdraws the amount from a user's account in a single conditional UPDATE
 
-    def withdraw(self, amount):
+        The funds check is part of the WHERE clause, so concurrent
+        withdrawals cannot overdraw the account between read and write.
+
+        Returns:
+            Account, or None when the amount came from a sharded account's slots
+        """
         if amount <= 0:
             raise ValueError("Amount must be positive")
-        if self.balance < amount:
+        stmt = (
+            update(Account)
+            .where(Account.user_id == user_id, Account.balance >= amount)
+            .values(balance=Account.balance - amount, updated_at=datetime.utcnow())
+            .returning(Account)
+        )
+        account = db.session.scalars(stmt).one_or_none()
+        if account is None:
+            # A sharded account keeps nothing on its row, so try its slots
+            account_id = select(Account.id).where(Account.user_id == user_id).scalar_subquery()
+            if Account.withdraw_from_slots(account_id, amount):
+                return None
+            # Only the failure path pays for a second lookup
+            if Account.for_user(user_id) is None:
+                raise ValueError("User has no account")
             raise ValueError("Insufficient funds")
-        self.balance -= amount
-        self.updated_at = datetime.utcnow()
+        return account
+
+    @staticmethod
+    def random_slot(account_id):
+        """SQL expression picking a random slot number of a sharded account (NULL if it is not sharded)"""
+        # nullif: Postgres raises on modulo by zero, so unsharded accounts match no slot instead
+        return (
+            select(literal(random.randrange(1 << 30)) % func.nullif(Account.slots, 0))
+            .where(Account.id == account_id)
+            .scalar_subquery()
+        )
+
+    @staticmethod
+    def withdraw_from_slots(account_id, amount):
+        """
+        Withdraws the amount from one random slot of a sharded account
+
+        When that slot runs short, every slot is locked and what is left of
+        the balance is spread evenly over them again.
+
+        Args:
+            account_id: Account id, or a scalar subquery selecting it
+
+        Returns:
+            bool: False if the account has no slots or not enough funds
+        """
+        result = db.session.execute(
+            update(AccountSlot)
+            .where(
+                AccountSlot.account_id == account_id,
+                AccountSlot.slot == Account.random_slot(account_id),
+                AccountSlot.balance >= amount
+            )
+            .values(balance=AccountSlot.balance - amount),
+            execution_options={'synchronize_session': False}
+        )
+        if result.rowcount:
+            return True
+
+        slots = db.session.execute(
+            select(AccountSlot.account_id, AccountSlot.balance)
+            .where(AccountSlot.account_id == account_id)
+            .order_by(AccountSlot.slot)
+            .with_for_update()
+        ).all()
+        total = sum(balance for _, balance in slots)
+        if not slots or total < amount:
+            return False
+        Account.spread(slots[0].account_id, total - amount, len(slots))
+        return True
+
+    @staticmethod
+    def spread(account_id, total, slots):
+        """Overwrite a sharded account's slots with an even split of total, in one UPDATE"""
+        even = total / slots
+        db.session.execute(
+            update(AccountSlot)
+            .where(AccountSlot.account_id == account_id)
+            .values(balance=case((AccountSlot.slot == 0, total - even * (slots - 1)), else_=even)),
+            execution_options={'synchronize_session': False}
+        )
+
+    @staticmethod
+    def shard(account_id, slots):
+        """
+        Splits an account's balance over ``slots`` AccountSlot rows
+
+        Hot accounts then spread concurrent deposits and withdrawals over
+        several rows instead of serializing on one. ``slots`` below 2 moves
+        the balance back onto the account row. Does not commit.
+
+        Returns:
+            Account or None if the account does not exist
+        """
+        account = db.session.get(Account, account_id, with_for_update=True)
+        if account is None:
+            return None
+        existing = db.session.scalars(
+            select(AccountSlot.balance).where(AccountSlot.account_id == account_id).with_for_update()
+        ).all()
+        total = account.balance + sum(existing)
+        db.session.execute(delete(AccountSlot).where(AccountSlot.account_id == account_id))
+
+        if slots < 2:
+            account.balance, account.slots = total, 0
+        else:
+            account.balance, account.slots = 0.0, slots
+            db.session.execute(insert(AccountSlot.__table__), [
+                {'account_id': account_id, 'slot': slot, 'balance': 0.0} for slot in range(slots)
+            ])
+            Account.spread(account_id, total, slots)
+        account.updated_at = datetime.utcnow()
+        db.session.flush()
+        db.session.expire(account, ['total_balance'])
+        return account
 
     def to_dict(self):
         return {
             "id": self.id,
             "user_id": self.user_id,
-            "balance": self.balance,
+            "balance": self.total_balance,
             "created_at": self.created_at,
             "updated_at": self.updated_at
         }
 
+class AccountSlot(db.Model):
+    """One share of a sharded account's balance, see Account.shard()."""
+    __tablename__ = 'account_slot'
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    balance = db.Column(db.Float, nullable=False, default=0.0)
+
+# Balance as clients see it: the row itself plus the slots of a sharded account
+Account.total_balance = column_property(
+    Account.balance + select(func.coalesce(func.sum(AccountSlot.balance), 0.0))
+    .where(AccountSlot.account_id == Account.id)
+    .correlate_except(AccountSlot)
+    .scalar_subquery()
+)
+
+class LedgerEntry(db.Model):
+    """One money movement of an account; rows are only ever appended, see ledger.py."""
+    __tablename__ = 'ledger_entry'
+    __table_args__ = (
+        db.Index('ix_ledger_entry_account_id_created_at', 'account_id', 'created_at', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id', ondelete='CASCADE'), nullable=False)
+    # Credits are positive, debits negative
+    amount = db.Column(db.Float, nullable=False)
+    # 'open', 'deposit' or 'withdrawal'
+    kind = db.Column(db.String(16), nullable=False)
+    # Record a withdrawal paid for; no foreign key, as the record may move to record_archive
+    record_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @staticmethod
+    def append(account_id, amount, kind, record_id=None):
+        """
+        Appends one entry in a single INSERT
+
+        Args:
+            account_id: Account id, or a scalar subquery selecting it
+            amount: Signed amount, negative for debits
+        """
+        db.session.execute(insert(LedgerEntry).values(
+            account_id=account_id, amount=amount, kind=kind, record_id=record_id, created_at=datetime.utcnow()
+        ))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "amount": self.amount,
+            "kind": self.kind,
+            "record_id": self.record_id,
+            "created_at": self.created_at
+        }
+
+class BalanceCheckpoint(db.Model):
+    """An account's balance after the ledger entry entry_id, written by ledger.checkpoint_ledger()."""
+    __tablename__ = 'balance_checkpoint'
+    __table_args__ = (
+        db.Index('ix_balance_checkpoint_account_id_created_at', 'account_id', 'created_at', 'entry_id'),
+    )
+
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+    entry_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # created_at of the entry, so checkpoints sort with the entries they cover
+    created_at = db.Column(db.DateTime, nullable=False)
+    balance = db.Column(db.Float, nullable=False)
+
 class Category(db.Model):
+    __table_args__ = (
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     records = db.relationship('Record', backref='category', lazy=True, cascade="all, delete-orphan")
 
     def __init__(self, name):
+        self.id = allocate_id(Category)
         self.name = name
         db.session.add(self)
         db.session.flush()
-        self.id = get_smallest_available_id(Category)
 
     def to_dict(self):
         return {
@@ -106,39 +435,177 @@ class Category(db.Model):
         }
 
 class Record(db.Model):
+    __table_args__ = (
+        db.Index('ix_record_user_id_date_time', 'user_id', 'date_time'),
+        db.Index('ix_record_category_id_date_time', 'category_id', 'date_time'),
+        db.Index('ix_record_date_time', 'date_time'),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id', ondelete='CASCADE'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     date_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     def __init__(self, user_id, category_id, amount):
+        self.id = allocate_id(Record)
         self.user_id = user_id
         self.category_id = category_id
         self.amount = amount
         self.date_time = datetime.utcnow()
         db.session.add(self)
         db.session.flush()
-        self.id = get_smallest_available_id(Record)
 
     @staticmethod
     def create_with_withdrawal(user_id, category_id, amount):
         """
         Creates a new record and withdraws the amount from the user's account
+
+        The withdrawal is appended to the ledger with the record's id.
         """
-        account = Account.query.filter_by(user_id=user_id).first()
-        if not account:
-            raise ValueError("User has no account")
-        
         try:
-            account.withdraw(amount)
+            account = Account.withdraw(user_id, amount)
             record = Record(user_id=user_id, category_id=category_id, amount=amount)
+            # A sharded account returns no row, so its id is looked up inside the INSERT
+            account_id = account.id if account is not None else (
+                select(Account.id).where(Account.user_id == user_id).scalar_subquery()
+            )
+            LedgerEntry.append(account_id, -amount, 'withdrawal', record.id)
             db.session.commit()
             return record
         except Exception as e:
             db.session.rollback()
             raise e
 
+    @staticmethod
+    def create_batch(items, atomic=True):
+        """
+        Creates many records and withdraws their amounts in one transaction.
+
+        Users, categories and accounts are checked with one set-based query
+        each, balances are settled per account in a single pass and the
+        records are bulk-inserted, followed by their ledger entries.
+
+        Args:
+            items: List of dicts with user_id, category_id and amount
+            atomic: Reject the whole batch if any item fails
+
+        Returns:
+            tuple: (created, errors) - created is a list of (index, record
+            dict) and errors maps item index to an error message
+        """
+        user_ids = {item['user_id'] for item in items}
+        category_ids = {item['category_id'] for item in items}
+        known_users = set(db.session.scalars(select(User.id).where(User.id.in_(user_ids))))
+        known_categories = set(
+            db.session.scalars(select(Category.id).where(Category.id.in_(category_ids)))
+        )
+        accounts = {
+            account.user_id: account
+            for account in Account.query.filter(Account.user_id.in_(user_ids)).with_for_update()
+        }
+
+        # Slot withdrawals leave the account row alone, so the slots of sharded
+        # accounts are locked too and their balances read from the locked rows
+        slot_balances = {}
+        sharded = [account.id for account in accounts.values() if account.slots]
+        if sharded:
+            for account_id, balance in db.session.execute(
+                select(AccountSlot.account_id, AccountSlot.balance)
+                .where(AccountSlot.account_id.in_(sharded))
+                .with_for_update()
+            ):
+                slot_balances[account_id] = slot_balances.get(account_id, 0.0) + balance
+        opening = {
+            user_id: account.balance + slot_balances.get(account.id, 0.0)
+            for user_id, account in accounts.items()
+        }
+
+        balances = dict(opening)
+        accepted = []
+        errors = {}
+        for index, item in enumerate(items):
+            user_id = item['user_id']
+            if user_id not in known_users:
+                errors[index] = 'User does not exist'
+            elif item['category_id'] not in known_categories:
+                errors[index] = 'Category does not exist'
+            elif user_id not in accounts:
+                errors[index] = 'User has no account'
+            elif balances[user_id] < item['amount']:
+                errors[index] = 'Insufficient funds'
+            else:
+                balances[user_id] -= item['amount']
+                accepted.append(index)
+
+        if not accepted or (atomic and errors):
+            db.session.rollback()
+            return [], errors
+
+        try:
+            now = datetime.utcnow()
+            short = set()
+            for user_id, balance in balances.items():
+                account = accounts[user_id]
+                if balance == opening[user_id]:
+                    continue
+                if account.slots:
+                    # Only fails where the slots could not be locked (SQLite); the withdrawal then changed nothing
+                    if not Account.withdraw_from_slots(account.id, opening[user_id] - balance):
+                        short.add(user_id)
+                else:
+                    account.balance = balance
+                    account.updated_at = now
+            if short:
+                for index in accepted:
+                    if items[index]['user_id'] in short:
+                        errors[index] = 'Insufficient funds'
+                accepted = [index for index in accepted if items[index]['user_id'] not in short]
+                if not accepted or atomic:
+                    db.session.rollback()
+                    return [], errors
+            db.session.flush()
+
+            rows = [
+                {
+                    'user_id': items[index]['user_id'],
+                    'category_id': items[index]['category_id'],
+                    'amount': items[index]['amount'],
+                    'date_time': now
+                }
+                for index in accepted
+            ]
+
+            # Explicit ids keep the insert a single executemany, with no
+            # per-row RETURNING needed to map rows back to items
+            ids = allocate_ids(Record, len(rows))
+            ids += reserve_ids(Record, len(rows) - len(ids))
+            for row, id in zip(rows, ids):
+                row['id'] = id
+            db.session.execute(insert(Record.__table__), rows)
+            db.session.execute(insert(LedgerEntry.__table__), [
+                {
+                    'account_id': accounts[row['user_id']].id,
+                    'amount': -row['amount'],
+                    'kind': 'withdrawal',
+                    'record_id': row['id'],
+                    'created_at': now
+                }
+                for row in rows
+            ])
+
+            # Bulk inserts skip mapper events, so fold the batch in directly
+            apply_spending(db.session.connection(), [
+                (row['user_id'], row['category_id'], row['amount'], row['date_time']) for row in rows
+            ])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise e
+
+        return list(zip(accepted, rows)), errors
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -146,4 +613,238 @@ class Record(db.Model):
             "category_id": self.category_id,
             "amount": self.amount,
             "date_time": self.date_time
-        }
\ No newline at end of file
+        }
+
+class RecordArchive(db.Model):
+    """
+    Records moved out of the record table by archive_records().
+
+    Rows keep their ids, which stay out of the free list until the archived
+    record is purged; reads merge both tables through all_records().
+    """
+    __tablename__ = 'record_archive'
+    __table_args__ = (
+        db.Index('ix_record_archive_user_id_date_time', 'user_id', 'date_time'),
+        db.Index('ix_record_archive_category_id_date_time', 'category_id', 'date_time'),
+        db.Index('ix_record_archive_date_time', 'date_time'),
+    )
+    # Archived rows share the record id space, and its free list
+    id_table = 'record'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id', ondelete='CASCADE'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    date_time = db.Column(db.DateTime, nullable=False)
+
+class ArchivePartition(db.Model):
+    """
+    Manifest of record_archive: one row per archived month.
+
+    Reads skip the archive when no partition overlaps their date range.
+    Bounds and counts are as archived; purges do not shrink them.
+    """
+    __tablename__ = 'archive_partition'
+    month = db.Column(db.Date, primary_key=True)
+    first_date_time = db.Column(db.DateTime, nullable=False)
+    last_date_time = db.Column(db.DateTime, nullable=False)
+    records = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "month": self.month.isoformat(),
+            "first_date_time": self.first_date_time,
+            "last_date_time": self.last_date_time,
+            "records": self.records,
+            "archived_at": self.archived_at
+        }
+
+class SpendingTotal(db.Model):
+    """
+    Running spending totals, one row per user, per category and per month.
+
+    ``dimension`` is one of SPENDING_DIMENSIONS and ``key`` is the user id,
+    the category id or a 'YYYY-MM' month.
+    """
+    __tablename__ = 'spending_total'
+    dimension = db.Column(db.String(16), primary_key=True)
+    key = db.Column(db.String(32), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            "dimension": self.dimension,
+            "key": self.key,
+            "total": self.total,
+            "count": self.count
+        }
+
+SPENDING_DIMENSIONS = ('user', 'category', 'month')
+
+def spending_keys(user_id, category_id, date_time):
+    """Aggregate keys a single record contributes to, by dimension."""
+    return {
+        'user': str(user_id),
+        'category': str(category_id),
+        'month': date_time.strftime('%Y-%m'),
+    }
+
+def apply_spending(connection, rows, sign=1):
+    """
+    Add (or with sign=-1 subtract) records into the spending totals.
+
+    Rows are folded per aggregate key first and written with a single
+    executemany upsert, so a batch of records costs one statement.
+
+    Args:
+        connection: Connection of the transaction the records belong to
+        rows: Iterable of (user_id, category_id, amount, date_time), or of
+            (user_id, category_id, total, date_time, count) for records
+            already grouped per user, category and month
+        sign: 1 for inserted records, -1 for deleted ones
+    """
+    deltas = {}
+    for user_id, category_id, amount, date_time, *grouped in rows:
+        n = grouped[0] if grouped else 1
+        for dimension, key in spending_keys(user_id, category_id, date_time).items():
+            total, count = deltas.get((dimension, key), (0.0, 0))
+            deltas[(dimension, key)] = (total + sign * amount, count + sign * n)
+
+    if not deltas:
+        return
+    table = SpendingTotal.__table__
+    rows = [
+        {'dimension': dimension, 'key': key, 'total': total, 'count': count}
+        for (dimension, key), (total, count) in deltas.items()
+    ]
+
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif connection.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        upsert = None
+
+    if upsert is not None:
+        stmt = upsert(table)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['dimension', 'key'],
+            set_={
+                'total': table.c.total + stmt.excluded.total,
+                'count': table.c.count + stmt.excluded.count,
+            },
+        ), rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.dimension == row['dimension'], table.c.key == row['key'])
+            .values(total=table.c.total + row['total'], count=table.c.count + row['count'])
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+class DailySpending(db.Model):
+    """
+    Spending pre-rolled per day, user and category for closed days.
+
+    Only days before the rollup watermark (RollupState.rolled_until) are
+    complete; later days are always read from the record table.
+    """
+    __tablename__ = 'daily_spending'
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class RollupState(db.Model):
+    """Watermark of a rollup table, bumped to a new version whenever it moves back."""
+    __tablename__ = 'rollup_state'
+    name = db.Column(db.String(32), primary_key=True)
+    rolled_until = db.Column(db.Date, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class PurgeJob(db.Model):
+    """Background purge of a user or category, deleting its records in chunks."""
+    __tablename__ = 'purge_job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    deleted = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    @staticmethod
+    def active(kind, target_id):
+        """Pending or running job for the same target, so repeated deletes do not start another"""
+        return PurgeJob.query.filter(
+            PurgeJob.kind == kind,
+            PurgeJob.target_id == target_id,
+            PurgeJob.status.in_(['pending', 'running'])
+        ).first()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "target_id": self.target_id,
+            "status": self.status,
+            "deleted": self.deleted,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+def invalidate_rollup(connection, date_times):
+    """
+    Move the daily_spending watermark back before the earliest day touched.
+
+    Records of the current day never reach the rollup, so the usual insert or
+    delete of fresh records costs no statement at all.
+
+    Args:
+        connection: Connection of the transaction the records belong to
+        date_times: date_time of every inserted or deleted record
+    """
+    today = datetime.utcnow().date()
+    days = [date_time.date() for date_time in date_times if date_time.date() < today]
+    if not days:
+        return
+    day = min(days)
+    table = RollupState.__table__
+    connection.execute(
+        update(table)
+        .where(table.c.name == 'daily_spending', table.c.rolled_until > day)
+        .values(rolled_until=day, version=table.c.version + 1)
+    )
+
+def after_flush(session, flush_context):
+    """
+    Fold the rows of a flush into the free list, spending totals and rollups.
+
+    Runs once per flush rather than once per row, so cascades that delete
+    many records still cost one statement per side table.
+    """
+    connection = session.connection()
+    release_ids(connection, [
+        (obj.__tablename__, obj.id) for obj in session.deleted
+        if isinstance(obj, (User, Account, Category, Record))
+    ])
+
+    def spending_rows(objects):
+        return [
+            (obj.user_id, obj.category_id, obj.amount, obj.date_time)
+            for obj in objects if isinstance(obj, Record)
+        ]
+    created, deleted = spending_rows(session.new), spending_rows(session.deleted)
+    apply_spending(connection, created)
+    apply_spending(connection, deleted, sign=-1)
+    invalidate_rollup(connection, [row[3] for row in created + deleted])
+
+event.listen(Session, 'after_flush', after_flush)
@@ -0,0 +1,85 @@
+import base64
+import json
+from datetime import datetime
+
+from marshmallow import Schema, fields, validate, ValidationError
+from sqlalchemy import DateTime, tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class PageSchema(Schema):
+    limit = fields.Int(load_default=DEFAULT_LIMIT, validate=validate.Range(min=1, max=MAX_LIMIT))
+    cursor = fields.Str(load_default=None)
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row on a page as an opaque token."""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """
+    Decode a token produced by encode_cursor back into sort key values.
+
+    Args:
+        cursor: Opaque cursor string from a previous page
+        columns: Columns the page is ordered by
+
+    Returns:
+        list: Values matching ``columns``
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if isinstance(c.type, DateTime) else v
+            for c, v in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise ValidationError({'cursor': ['Invalid cursor']})
+
+
+def keyset_filter(stmt, columns, limit, cursor=None):
+    """
+    Restrict a query or select() to one keyset page.
+
+    Rows are ordered by ``columns`` (the last one must be unique, e.g. the
+    primary key) and the page starts strictly after the cursor, so the cost
+    depends on ``limit`` rather than on how deep into the table we are.
+    One extra row is fetched to tell whether another page follows.
+    """
+    if cursor is not None:
+        stmt = stmt.filter(tuple_(*columns) > tuple_(*decode_cursor(cursor, columns)))
+    return stmt.order_by(*columns).limit(limit + 1)
+
+
+def finish_page(rows, columns, limit):
+    """
+    Trim the extra row fetched by keyset_filter and build the next cursor.
+
+    Returns:
+        tuple: (rows, next_cursor); next_cursor is None on the last page
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in columns])
+    return rows, next_cursor
+
+
+def paginate(query, columns, limit, cursor=None):
+    """
+    Fetch one page of ``query`` using keyset pagination.
+
+    Returns:
+        tuple: (rows, next_cursor); next_cursor is None on the last page
+    """
+    rows = keyset_filter(query, columns, limit, cursor).all()
+    return finish_page(rows, columns, limit)
@@ -0,0 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, func, select
+
+from .aggregates import month_of
+from .archive import records_with_archived
+from .cache import invalidate
+from .models import (
+    db, User, Account, AccountSlot, LedgerEntry, BalanceCheckpoint, Category, Record, RecordArchive, PurgeJob,
+    apply_spending, invalidate_rollup, release_where,
+)
+
+# Owner model and the name of the record column pointing at it, by purge kind
+OWNERS = {
+    'user': (User, 'user_id'),
+    'category': (Category, 'category_id'),
+}
+
+
+def purge_records(condition, released=()):
+    """
+    Delete every record matching ``condition`` with set-based statements.
+
+    Hot and archived records are both deleted. They are folded out of the
+    spending totals per user, category and month, their ids go back to the
+    free list and the rollup watermark moves back if any of them was already
+    rolled up; none of them is loaded.
+
+    Args:
+        condition: Function of Record or RecordArchive returning the filter
+            selecting the records to delete
+        released: Further (model, condition) rows about to be deleted, whose
+            ids are released in the same statement as the records'
+
+    Returns:
+        int: number of deleted records
+    """
+    connection = db.session.connection()
+    records = records_with_archived(condition)
+    groups = db.session.execute(
+        select(
+            records.c.user_id, records.c.category_id, func.sum(records.c.amount),
+            func.min(records.c.date_time), func.count(records.c.id), records.c.archived
+        ).group_by(records.c.user_id, records.c.category_id, month_of(records.c.date_time), records.c.archived)
+    ).all()
+    # Only the tables that actually hold matching records are written to
+    models = [model for model, archived in ((Record, False), (RecordArchive, True))
+              if any(bool(group[5]) == archived for group in groups)]
+    release_where(connection, [(model, condition(model)) for model in models] + list(released))
+    if not groups:
+        return 0
+    apply_spending(connection, [group[:5] for group in groups], sign=-1)
+    invalidate_rollup(connection, [group[3] for group in groups])
+    for model in models:
+        db.session.execute(delete(model).where(condition(model)), execution_options={'synchronize_session': False})
+    return sum(group[4] for group in groups)
+
+
+def purge_owner(kind, target_id):
+    """
+    Delete a user (with accounts and their ledgers) or a category together with all its records.
+
+    The owner row is locked first so records cannot be added under it while
+    the purge runs. Commits on success.
+
+    Returns:
+        int: number of deleted records, or None if the owner does not exist
+    """
+    model, column = OWNERS[kind]
+    owner = db.session.execute(
+        select(model.id).where(model.id == target_id).with_for_update()
+    ).scalar_one_or_none()
+    if owner is None:
+        return None
+
+    released = [(model, model.id == target_id)]
+    if model is User:
+        released.append((Account, Account.user_id == target_id))
+    deleted = purge_records(lambda records: getattr(records, column) == target_id, released)
+    if model is User:
+        accounts = select(Account.id).where(Account.user_id == target_id)
+        for child in (AccountSlot, LedgerEntry, BalanceCheckpoint):
+            db.session.execute(delete(child).where(child.account_id.in_(accounts)),
+                               execution_options={'synchronize_session': False})
+        db.session.execute(delete(Account).where(Account.user_id == target_id),
+                           execution_options={'synchronize_session': False})
+    db.session.execute(delete(model).where(model.id == target_id),
+                       execution_options={'synchronize_session': False})
+    db.session.commit()
+    if model is Category:
+        invalidate('categories')
+    return deleted
+
+
+def start_purge(kind, target_id):
+    """
+    Queue a background purge of a user or category, reusing an active one.
+
+    Returns:
+        PurgeJob: the queued (or already running) job
+    """
+    job = PurgeJob.active(kind, target_id)
+    if job is None:
+        job = PurgeJob(kind=kind, target_id=target_id, status='pending')
+        db.session.add(job)
+        db.session.commit()
+        get_executor().submit(run_purge, current_app._get_current_object(), job.id)
+    return job
+
+
+def run_purge(app, job_id):
+    """
+    Delete the job's records in chunks of PURGE_CHUNK_SIZE, then the owner.
+
+    Every chunk is its own short transaction, so a large history never holds
+    locks or memory for long. Hot records go first, then archived ones; the
+    final purge_owner() picks up whatever was added meanwhile.
+    """
+    with app.app_context():
+        job = db.session.get(PurgeJob, job_id)
+        job.status = 'running'
+        db.session.commit()
+        try:
+            _, column = OWNERS[job.kind]
+            chunk = app.config.get('PURGE_CHUNK_SIZE', 1000)
+            for model in (Record, RecordArchive):
+                while True:
+                    ids = db.session.execute(
+                        select(model.id).where(getattr(model, column) == job.target_id)
+                        .order_by(model.id).limit(chunk).with_for_update()
+                    ).scalars().all()
+                    if not ids:
+                        break
+                    job.deleted += purge_records(lambda records: records.id.in_(ids))
+                    db.session.commit()
+            job.deleted += purge_owner(job.kind, job.target_id) or 0
+            job.status = 'done'
+        except Exception as e:
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        db.session.remove()
+
+
+def get_executor():
+    """Return the current app's purge thread, creating it on first use."""
+    executor = current_app.extensions.get('purge_executor')
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+        current_app.extensions['purge_executor'] = executor
+    return executor
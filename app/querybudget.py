@@ -0,0 +1,93 @@
+"""
+Per-request SQL statement budgets and repeated-statement (N+1) detection.
+
+Views declare their budget with @query_budget(n). Every statement executed
+while serving a request is fingerprinted; when a request runs more
+statements than its budget, or runs the same fingerprint
+QUERY_REPEAT_THRESHOLD times or more, the offence is either raised as
+QueryBudgetExceeded (QUERY_BUDGET_MODE='raise', for tests) or logged with
+the offending fingerprints (the default 'log'). Transaction control
+statements are not counted, so budgets hold inside fixtures.rolled_back(),
+and neither are connections opted out with execution_options(query_budget=False).
+"""
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|\$\d+|(?<!:):\w+')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+_TRANSACTION = re.compile(r'\s*(?:BEGIN|SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.IGNORECASE)
+
+
+def fingerprint(statement):
+    """Normalize a SQL statement so that only its shape remains."""
+    sql = _STRING.sub('?', statement)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def query_budget(max_statements, max_repeats=None):
+    """Declare the statement budget of a view; place it right under @app.route."""
+    def decorator(view):
+        view.query_budget = max_statements
+        view.query_max_repeats = max_repeats
+        return view
+    return decorator
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget:
+    def __init__(self, app, db):
+        self.app = app
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        with app.app_context():
+            self.instrument_engine(db.engine)
+        app.extensions['query_budget'] = self
+
+    def instrument_engine(self, engine):
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if (has_request_context() and 'query_log' in g and not _TRANSACTION.match(statement)
+                    and conn.get_execution_options().get('query_budget', True)):
+                g.query_log.append(statement)
+
+    def _before_request(self):
+        g.query_log = []
+
+    def _after_request(self, response):
+        statements = g.pop('query_log', None)
+        view = current_app.view_functions.get(request.endpoint)
+        if statements is None or view is None:
+            return response
+
+        problems = []
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None and len(statements) > budget:
+            problems.append(f'{len(statements)} statements, budget is {budget}')
+
+        threshold = getattr(view, 'query_max_repeats', None) or current_app.config.get('QUERY_REPEAT_THRESHOLD', 3)
+        counts = Counter(fingerprint(s) for s in statements)
+        for sql, count in counts.items():
+            if count >= threshold:
+                problems.append(f'{count}x repeated: {sql}')
+
+        if problems:
+            details = '\n  '.join(problems + [f'{n}x {sql}' for sql, n in counts.most_common()])
+            message = f'Query budget exceeded for {request.method} {request.path}:\n  {details}'
+            if current_app.config.get('QUERY_BUDGET_MODE', 'log') == 'raise':
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
@@ -0,0 +1,189 @@
+"""
+Per-client rate limiting and load shedding.
+
+Every request spends tokens from a bucket keyed by the client: its JWT
+identity, or its address on routes without a valid token (/login,
+/register). Buckets hold RATE_LIMIT_BURST tokens and refill at
+RATE_LIMIT_PER_SECOND; views declare what they cost with @rate_cost(n)
+(1 by default, 0 exempts the view). A client with too few tokens gets a
+429 telling it when to retry.
+
+MAX_CONCURRENT_REQUESTS caps the requests being served at once. It is
+meant to sit below the connection pool, so excess requests get a 503
+straight away instead of queueing for a connection until they time out.
+
+Buckets and the in-flight count live in a store chosen by
+RATE_LIMIT_STORAGE_URL, like the cache: 'local://' keeps them in each
+worker process, 'redis://...' shares them across the deployment.
+"""
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, request
+
+IN_FLIGHT = 'in-flight'
+
+
+def rate_cost(cost):
+    """Declare the tokens a request to a view spends; place it under @query_budget."""
+    def decorator(view):
+        view.rate_cost = cost
+        return view
+    return decorator
+
+
+def client_identity():
+    """JWT identity of the request, or the client address when it carries no valid token."""
+    from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f'user:{identity}' if identity is not None else f'addr:{request.remote_addr}'
+
+
+class LocalLimiterStore:
+    """Buckets and in-flight count private to each worker process."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, rate, burst):
+        """Spend ``cost`` tokens; returns 0 on success, else the seconds until they are available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            # Evicting the least recently seen client only refills its bucket early
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def acquire(self, key, limit):
+        """Take one of ``limit`` slots; returns a token for release(), or None when all are taken."""
+        with self._lock:
+            if self._in_flight.get(key, 0) >= limit:
+                return None
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            return key
+
+    def release(self, key, token):
+        with self._lock:
+            self._in_flight[key] -= 1
+
+
+class RedisLimiterStore:
+    """Buckets and in-flight count shared by every worker process through Redis."""
+
+    TAKE = '''
+    local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    '''
+
+    # Slots are scored by when they were taken, so slots of a worker that died
+    # mid-request stop counting after ``slot_timeout`` seconds
+    ACQUIRE = '''
+    local now, timeout, limit = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - timeout)
+    if redis.call('ZCARD', KEYS[1]) >= limit then return 0 end
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('EXPIRE', KEYS[1], math.ceil(timeout))
+    return 1
+    '''
+
+    def __init__(self, url, prefix='kpi:ratelimit:', slot_timeout=60):
+        import redis  # optional, only needed for multi-process deployments
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.slot_timeout = slot_timeout
+        self._take = self._client.register_script(self.TAKE)
+        self._acquire = self._client.register_script(self.ACQUIRE)
+
+    def take(self, key, cost, rate, burst):
+        return float(self._take(keys=[self.prefix + key], args=[rate, burst, cost, time.time()]))
+
+    def acquire(self, key, limit):
+        token = uuid.uuid4().hex
+        args = [time.time(), self.slot_timeout, limit, token]
+        return token if self._acquire(keys=[self.prefix + key], args=args) else None
+
+    def release(self, key, token):
+        self._client.zrem(self.prefix + key, token)
+
+
+def get_limiter_store():
+    """Return the current app's rate limit store, chosen by RATE_LIMIT_STORAGE_URL."""
+    store = current_app.extensions.get('rate_limit_store')
+    if store is None:
+        url = current_app.config.get('RATE_LIMIT_STORAGE_URL', 'local://')
+        if url.startswith('redis://'):
+            store = RedisLimiterStore(url)
+        else:
+            store = LocalLimiterStore(current_app.config.get('RATE_LIMIT_MAX_KEYS', 10000))
+        current_app.extensions['rate_limit_store'] = store
+    return store
+
+
+class RateLimiter:
+    def __init__(self, app):
+        self.app = app
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['rate_limiter'] = self
+
+    # Request hooks
+    def _before_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        cost = getattr(view, 'rate_cost', 1)
+        if not cost:
+            return
+        config = current_app.config
+        rate, burst = config.get('RATE_LIMIT_PER_SECOND', 0), config.get('RATE_LIMIT_BURST', 0)
+        limit = config.get('MAX_CONCURRENT_REQUESTS', 0)
+        try:
+            store = get_limiter_store()
+            if rate > 0 and burst > 0:
+                wait = store.take(f'bucket:{client_identity()}', min(cost, burst), rate, burst)
+                if wait > 0:
+                    return self.reject(429, 'Too many requests', wait)
+            if limit > 0:
+                slot = store.acquire(IN_FLIGHT, limit)
+                if slot is None:
+                    return self.reject(503, 'Server is busy, try again later', 1)
+                g.rate_limit_slot = slot
+        except Exception:
+            # Serve the request rather than fail it when the store is unreachable
+            current_app.logger.exception('Rate limit store failed')
+
+    def _teardown_request(self, exc):
+        slot = g.pop('rate_limit_slot', None)
+        if slot is None:
+            return
+        try:
+            get_limiter_store().release(IN_FLIGHT, slot)
+        except Exception:
+            current_app.logger.exception('Rate limit store failed')
+
+    def reject(self, status, message, retry_after):
+        return jsonify({'error': message}), status, {'Retry-After': str(math.ceil(retry_after))}
@@ -0,0 +1,128 @@
+"""
+Read-replica routing.
+
+Replicas are extra Flask-SQLAlchemy binds named 'replica0', 'replica1', ...
+(see READ_REPLICA_URIS). Views marked @read_only run all their statements
+on a random replica whose lag is within MAX_REPLICA_LAG seconds. Requests
+fall back to the primary when every replica lags too far, and for
+READ_YOUR_WRITES_SECONDS after the same client's last successful write,
+so clients always see their own changes.
+
+Replica lag comes from the WAL replay position on Postgres. SQLite has
+no replication to ask, so there the lag is approximated by the age of the
+replica file, which `flask replicate` refreshes by copying the primary.
+That approximation only serves to try routing locally with two database
+files: any other write to the file resets it whatever the data, so it
+must not be relied on in a deployment.
+"""
+import math
+import os
+import random
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+from .cache import get_cache
+from .ratelimit import client_identity
+
+PG_LAG = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+def read_only(view):
+    """Allow a view to be served from a read replica; place it under @query_budget."""
+    view.read_only = True
+    return view
+
+
+class RoutingSession(Session):
+    """Session sending the statements of @read_only requests to the replica picked for them."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            key = g.get('read_bind')
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+        self.keys = sorted(key for key in app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith('replica'))
+        self._lag = {}
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        with app.app_context():
+            for key in self.keys:
+                for extension in ('metrics', 'query_budget', 'slow_queries'):
+                    if extension in app.extensions:
+                        app.extensions[extension].instrument_engine(db.engines[key])
+        app.extensions['replicas'] = self
+
+    # Request hooks
+    def _before_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        if not self.keys or not getattr(view, 'read_only', False):
+            return
+        if self.wrote_recently(self.identity()):
+            return
+        healthy = [key for key in self.keys if self.lag(key) <= current_app.config.get('MAX_REPLICA_LAG', 5.0)]
+        if healthy:
+            g.read_bind = random.choice(healthy)
+
+    def _after_request(self, response):
+        if self.keys and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            # Only read within READ_YOUR_WRITES_SECONDS, so it need not outlive them
+            window = current_app.config.get('READ_YOUR_WRITES_SECONDS', 5.0)
+            get_cache().set(self._write_key(self.identity()), time.time(), timeout=math.ceil(window) + 1)
+        if g.get('read_bind'):
+            response.headers['X-Read-Replica'] = g.read_bind
+        return response
+
+    # Read-your-writes
+    def identity(self):
+        return client_identity()
+
+    def _write_key(self, identity):
+        return f'last-write:{identity}'
+
+    def wrote_recently(self, identity):
+        last = get_cache().get(self._write_key(identity))
+        return last is not None and time.time() - last < current_app.config.get('READ_YOUR_WRITES_SECONDS', 5.0)
+
+    # Lag
+    def lag(self, key):
+        """Replication lag of a replica in seconds, re-measured at most every REPLICA_LAG_CHECK_SECONDS."""
+        if key in self._lag:
+            checked, lag = self._lag[key]
+            if time.monotonic() - checked < current_app.config.get('REPLICA_LAG_CHECK_SECONDS', 1.0):
+                return lag
+        lag = self.measure_lag(self.db.engines[key])
+        self._lag[key] = (time.monotonic(), lag)
+        return lag
+
+    def measure_lag(self, engine):
+        try:
+            if engine.dialect.name == 'sqlite':
+                # Local testing only: the time since `flask replicate` last copied the file
+                return time.time() - os.path.getmtime(engine.url.database)
+            with engine.connect().execution_options(query_budget=False) as connection:
+                lag = connection.execute(PG_LAG).scalar()
+            return float('inf') if lag is None else float(lag)
+        except Exception:
+            current_app.logger.exception('Could not measure replica lag')
+            return float('inf')
+
+
+def replicate_sqlite(primary, replicas):
+    """Copy a primary SQLite file over its replica files (local testing of replica routing)."""
+    from .fixtures import copy_sqlite
+    for path in replicas:
+        copy_sqlite(primary, path)
+        os.utime(path)
@@ -0,0 +1,160 @@
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import Date, DateTime, and_, cast, delete, func, insert, or_, select
+
+from .archive import all_records
+from .models import db, DailySpending, RollupState
+
+BUCKETS = ('day', 'week', 'month')
+GROUPINGS = ('user', 'category')
+
+# Name of the daily_spending row in rollup_state
+ROLLUP = 'daily_spending'
+
+
+def bucket_of(column, bucket):
+    """SQL expression truncating a date(time) column to its bucket start as 'YYYY-MM-DD'. Weeks start on Monday."""
+    if db.engine.dialect.name == 'sqlite':
+        if bucket == 'day':
+            return func.date(column)
+        if bucket == 'week':
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.strftime('%Y-%m-01', column)
+    return func.to_char(func.date_trunc(bucket, cast(column, DateTime)), 'YYYY-MM-DD')
+
+
+def day_of(column):
+    """SQL expression of the calendar day of a datetime column."""
+    if db.engine.dialect.name == 'sqlite':
+        return func.date(column)
+    return cast(column, Date)
+
+
+def rollup_state():
+    """Return (rolled_until, version) of the daily rollup; rolled_until is None before the first refresh."""
+    state = db.session.get(RollupState, ROLLUP)
+    return (state.rolled_until, state.version) if state else (None, 0)
+
+
+def is_closed(args, rolled_until):
+    """Whether the requested range ends before the watermark, so the report can no longer change."""
+    return rolled_until is not None and 'date_to' in args and args['date_to'] <= datetime.combine(rolled_until, time())
+
+
+def rollup_window(args, rolled_until):
+    """
+    Whole days of the requested range that the rollup can answer.
+
+    Returns:
+        tuple: (first, end) dates of a half-open window, first may be None
+        for an unbounded start; None if the rollup cannot help at all
+    """
+    if rolled_until is None:
+        return None
+    first = None
+    if 'date_from' in args:
+        start = args['date_from']
+        first = start.date() if start.time() == time() else start.date() + timedelta(days=1)
+    end = rolled_until
+    if 'date_to' in args:
+        end = min(end, args['date_to'].date())
+    if first is not None and first >= end:
+        return None
+    return first, end
+
+
+def spending_report(bucket, group_by, args, rolled_until):
+    """
+    Spending per time bucket, optionally split by user and/or category.
+
+    Closed whole days inside the range are summed from daily_spending and
+    the rest from the records (archived ones included), both grouped in
+    SQL; the two partial results are merged per bucket.
+
+    Args:
+        bucket: One of BUCKETS
+        group_by: Subset of GROUPINGS
+        args: Filters as loaded by RecordFilterSchema
+        rolled_until: Watermark from rollup_state()
+
+    Returns:
+        list: dicts with bucket, the grouped ids, total and count, ordered by bucket
+    """
+    window = rollup_window(args, rolled_until)
+    totals = {}
+
+    def run(table, when, amount, count, conditions):
+        keys = [bucket_of(when, bucket)] + [getattr(table, f'{name}_id') for name in group_by]
+        if 'user_id' in args:
+            conditions.append(table.user_id == args['user_id'])
+        if 'category_id' in args:
+            conditions.append(table.category_id == args['category_id'])
+        stmt = select(*keys, amount, count).where(*conditions).group_by(*keys)
+        for *key, total, n in db.session.execute(stmt):
+            have = totals.get(tuple(key), (0.0, 0))
+            totals[tuple(key)] = (have[0] + total, have[1] + n)
+
+    records = all_records(args.get('date_from'), args.get('date_to'))
+    raw = []
+    if 'date_from' in args:
+        raw.append(records.date_time >= args['date_from'])
+    if 'date_to' in args:
+        raw.append(records.date_time < args['date_to'])
+    if window is not None:
+        first, end = window
+        outside = records.date_time >= datetime.combine(end, time())
+        if first is not None:
+            outside = or_(records.date_time < datetime.combine(first, time()), outside)
+        raw.append(outside)
+
+        rolled = [DailySpending.day < end]
+        if first is not None:
+            rolled.append(DailySpending.day >= first)
+        run(DailySpending, DailySpending.day, func.sum(DailySpending.total), func.sum(DailySpending.count), rolled)
+    run(records, records.date_time, func.sum(records.amount), func.count(records.id), raw)
+
+    return [
+        {'bucket': key[0], **{f'{name}_id': value for name, value in zip(group_by, key[1:])},
+         'total': total, 'count': count}
+        for key, (total, count) in sorted(totals.items())
+    ]
+
+
+def refresh_rollup(until=None):
+    """
+    Roll closed days up into daily_spending.
+
+    Days from the current watermark up to ``until`` (today by default) are
+    recomputed from the records (archived ones included) in one transaction,
+    so moving the watermark back is enough to repair the rollup after old
+    records change.
+
+    Returns:
+        tuple: (first day recomputed or None, new watermark)
+    """
+    until = until or datetime.utcnow().date()
+    state = db.session.get(RollupState, ROLLUP, with_for_update=True)
+    start = state.rolled_until if state else None
+    if start is not None and start >= until:
+        return start, start
+
+    records = all_records(
+        datetime.combine(start, time()) if start is not None else None, datetime.combine(until, time())
+    )
+    day = day_of(records.date_time)
+    conditions = [records.date_time < datetime.combine(until, time())]
+    if start is not None:
+        conditions.append(records.date_time >= datetime.combine(start, time()))
+        db.session.execute(delete(DailySpending).where(DailySpending.day >= start))
+    db.session.execute(insert(DailySpending).from_select(
+        ['day', 'user_id', 'category_id', 'total', 'count'],
+        select(day, records.user_id, records.category_id, func.sum(records.amount), func.count(records.id))
+        .where(and_(*conditions))
+        .group_by(day, records.user_id, records.category_id)
+    ))
+    if state is None:
+        db.session.add(RollupState(name=ROLLUP, rolled_until=until, version=0))
+    else:
+        state.rolled_until = until
+    db.session.commit()
+    return start, until
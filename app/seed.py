@@ -0,0 +1,206 @@
+import csv
+from bisect import bisect
+import io
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+
+from sqlalchemy import bindparam, func, insert, select, text
+
+from .models import db, FreeId, User, Account, Category, Record, LedgerEntry, invalidate_rollup
+
+CATEGORY_NAMES = (
+    'Groceries', 'Rent', 'Transport', 'Utilities', 'Restaurants', 'Health',
+    'Entertainment', 'Clothing', 'Education', 'Travel', 'Gifts', 'Subscriptions',
+)
+
+
+class Dataset:
+    """
+    Synthetic users (one account each), categories and records.
+
+    Every table draws from its own RNG seeded from ``seed``, so the same
+    arguments always produce the same rows. Ids continue after the rows
+    already in the database. Spending is skewed like real traffic: a few
+    users and categories account for most records, and amounts are
+    log-normal.
+    """
+
+    def __init__(self, users, categories, records, seed=0, days=365, until=None):
+        self.users = users
+        self.categories = categories
+        self.records = records
+        self.seed = seed
+        self.days = days
+        self.until = until or datetime.combine(datetime.utcnow().date(), datetime.min.time())
+
+    def rng(self, table):
+        return random.Random(f'{self.seed}:{table}')
+
+    def tables(self, offsets, password_hash):
+        """
+        Return (model, columns, rows) per table in load order.
+
+        Args:
+            offsets: Highest existing id per table name
+            password_hash: Hash stored for every generated user
+        """
+        first_user = offsets['user'] + 1
+        first_category = offsets['category'] + 1
+        return [
+            (Category, ('id', 'name'), self._categories(first_category)),
+            (User, ('id', 'name', 'password'), (
+                (first_user + n, f'synthetic-{first_user + n}', password_hash) for n in range(self.users)
+            )),
+            (Account, ('id', 'user_id', 'balance', 'slots', 'created_at', 'updated_at'),
+             self._accounts(offsets['account'] + 1, first_user)),
+            (LedgerEntry, ('account_id', 'amount', 'kind', 'created_at'),
+             self._openings(offsets['account'] + 1, first_user)),
+            (Record, ('id', 'user_id', 'category_id', 'amount', 'date_time'),
+             self._records(offsets['record'] + 1, first_user, first_category)),
+        ]
+
+    def _categories(self, first):
+        for n in range(self.categories):
+            name = CATEGORY_NAMES[n] if n < len(CATEGORY_NAMES) else f'Category {n + 1}'
+            yield first + n, f'{name} #{first + n}'
+
+    def _accounts(self, first, first_user):
+        rnd = self.rng('account')
+        for n in range(self.users):
+            balance = round(rnd.uniform(0, 10000), 2)
+            yield first + n, first_user + n, balance, 0, self.until, self.until
+
+    def _openings(self, first, first_user):
+        # Same RNG seed as _accounts, so every opening entry matches its balance
+        for id, _, balance, _, created_at, _ in self._accounts(first, first_user):
+            if balance:
+                yield id, balance, 'open', created_at
+
+    def _records(self, first, first_user, first_category):
+        rnd = self.rng('record')
+        # Zipf-like category popularity
+        cumulative = list(accumulate(1 / (rank + 1) for rank in range(self.categories)))
+        # Arrivals are a Poisson process, so ids grow with date_time as in live
+        # traffic and the date indexes are appended to rather than shuffled
+        span = self.days * 86400
+        rate = self.records / span if span else float('inf')
+        offset = 0.0
+        start = self.until - timedelta(days=self.days)
+        for n in range(self.records):
+            offset = min(offset + rnd.expovariate(rate), span) if span else 0.0
+            user_id = first_user + int(self.users * rnd.random() ** 2)
+            category_id = first_category + bisect(cumulative, rnd.random() * cumulative[-1])
+            amount = round(rnd.lognormvariate(3, 1), 2) or 0.01
+            yield first + n, user_id, category_id, amount, start + timedelta(seconds=offset)
+
+
+def copy_rows(connection, table, columns, rows, batch_size):
+    """Stream rows into Postgres with COPY, one batch_size chunk of CSV at a time."""
+    cursor = connection.connection.cursor()
+    sql = f'COPY "{table.name}" ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+        count += len(batch)
+
+
+def insert_rows(connection, table, columns, rows, batch_size):
+    """
+    Insert rows with one DBAPI executemany per batch_size chunk.
+
+    The statement is compiled once and values only go through the column
+    types' bind processors, skipping Core's per-row parameter handling.
+    """
+    dialect = connection.dialect
+    sql = str(insert(table).values({name: bindparam(name) for name in columns}).compile(dialect=dialect))
+    processors = [
+        (index, processor) for index, name in enumerate(columns)
+        for processor in [table.c[name].type.dialect_impl(dialect).bind_processor(dialect)] if processor
+    ]
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        if processors:
+            batch = [list(row) for row in batch]
+            for row in batch:
+                for index, processor in processors:
+                    row[index] = processor(row[index])
+        connection.exec_driver_sql(sql, [tuple(row) for row in batch])
+        count += len(batch)
+
+
+def highest_id(model):
+    """
+    Highest id of a table that may already be in use or handed out.
+
+    Takes the existing rows, ids waiting on the free list and the sequence
+    into account, so loaded rows can never collide with ids the allocator
+    still gives out.
+    """
+    table = model.__tablename__
+    candidates = [
+        select(func.max(model.id)).scalar_subquery(),
+        select(func.max(FreeId.id)).where(FreeId.table_name == table).scalar_subquery(),
+    ]
+    if db.engine.dialect.name == 'postgresql':
+        candidates.append(text(
+            f"(SELECT pg_sequence_last_value(pg_get_serial_sequence('{table}', 'id')::regclass))"
+        ))
+    else:
+        candidates.append(text(f"(SELECT seq FROM sqlite_sequence WHERE name = '{table}')"))
+    return max(value or 0 for value in db.session.execute(select(*candidates)).one())
+
+
+def load(dataset, password_hash, batch_size=10000, report=None):
+    """
+    Load a dataset in a single transaction through the fastest bulk path.
+
+    Postgres uses COPY and SQLite executemany. Ids bypass the free list and
+    start above every id already used, released or drawn from the sequence.
+    The sequences are moved past the loaded ids, and the rollup watermark
+    moves back to the oldest generated record.
+
+    Args:
+        dataset: Dataset to load
+        password_hash: Hash stored for every generated user
+        batch_size: Rows per COPY chunk or executemany call
+        report: Called with (table name, rows, seconds) after each table
+
+    Returns:
+        list: (table name, rows, seconds) per table
+    """
+    connection = db.session.connection()
+    postgres = connection.dialect.name == 'postgresql'
+    offsets = {model.__tablename__: highest_id(model) for model in (User, Account, Category, Record)}
+
+    stats = []
+    for model, columns, rows in dataset.tables(offsets, password_hash):
+        start = time.perf_counter()
+        if postgres:
+            count = copy_rows(connection, model.__table__, columns, rows, batch_size)
+            # Only ever moves the sequence forward, past the loaded ids
+            sequence = f"pg_get_serial_sequence('{model.__tablename__}', 'id')"
+            connection.execute(text(
+                f'SELECT setval({sequence}, greatest((SELECT coalesce(max(id), 1) FROM "{model.__tablename__}"), '
+                f'coalesce(pg_sequence_last_value({sequence}::regclass), 1)))'
+            ))
+        else:
+            count = insert_rows(connection, model.__table__, columns, rows, batch_size)
+        stats.append((model.__tablename__, count, time.perf_counter() - start))
+        if report:
+            report(*stats[-1])
+
+    if dataset.records:
+        invalidate_rollup(connection, [dataset.until - timedelta(days=dataset.days)])
+    db.session.commit()
+    return stats
@@ -0,0 +1,251 @@
+"""
+Slow-query log.
+
+Every statement run on an instrumented engine is reduced to its
+fingerprint (querybudget.fingerprint: literals and parameters become ``?``)
+and timed. Per fingerprint the log keeps calls, total and maximum time,
+and the last SLOW_QUERY_SAMPLES durations, from which reports take the p95.
+
+Statements slower than SLOW_QUERY_MS are logged, and their plan is
+captured on a background thread with a connection of its own so the slow
+request is not held up further (see explain.explain_sql); statements of an
+async engine are explained by a task on its event loop instead. Each
+fingerprint is explained at most once per SLOW_QUERY_EXPLAIN_INTERVAL
+seconds, keeping EXPLAIN ANALYZE from adding load when the database is
+already struggling.
+
+With METRICS_DIR set, every process writes its log there next to its
+metrics, and report() merges all of them, so `flask slow-queries` and
+GET /admin/slow-queries cover the whole deployment. Logs of exited
+processes are folded into slowlog-archive.json by mark_process_dead().
+"""
+import asyncio
+import contextvars
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .explain import explain_sql, explain_sql_async
+from .querybudget import fingerprint
+
+# Only these have a plan; DDL and PRAGMAs are timed but never explained
+_EXPLAINABLE = re.compile(r'\s*(?:SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+# Statements repeat verbatim (parameters are bound separately), so normalize each one once
+_fingerprint = lru_cache(maxsize=4096)(fingerprint)
+
+
+def merge(snapshots):
+    """Combine slow-query snapshots of several processes, keyed by fingerprint."""
+    merged = {}
+    for snapshot in snapshots:
+        for entry in snapshot:
+            current = merged.get(entry['fingerprint'])
+            if current is None:
+                merged[entry['fingerprint']] = dict(entry)
+                continue
+            for key in ('calls', 'slow_calls', 'total_ms'):
+                current[key] += entry[key]
+            current['max_ms'] = max(current['max_ms'], entry['max_ms'])
+            current['samples'] = current['samples'] + entry['samples']
+            if entry['plan'] is not None and (current['plan_at'] or '') < entry['plan_at']:
+                current.update(plan=entry['plan'], plan_at=entry['plan_at'], plan_ms=entry['plan_ms'])
+    return merged
+
+
+def mark_process_dead(directory, pid, max_samples=100):
+    """Fold the log file of an exited process into slowlog-archive.json and remove it."""
+    path = os.path.join(directory, f'slowlog-{pid}.json')
+    if not os.path.exists(path):
+        return
+    archive = os.path.join(directory, 'slowlog-archive.json')
+    snapshots = []
+    for source in (archive, path):
+        if os.path.exists(source):
+            with open(source) as f:
+                snapshots.append(json.load(f))
+    entries = list(merge(snapshots).values())
+    for entry in entries:
+        entry['samples'] = entry['samples'][-max_samples:]
+    tmp = archive + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(entries, f)
+    os.replace(tmp, archive)
+    os.remove(path)
+
+
+def summarize(entry):
+    """Report row of a merged entry: samples are replaced by the mean and p95."""
+    row = {key: value for key, value in entry.items() if key != 'samples'}
+    samples = sorted(entry['samples'])
+    row['mean_ms'] = entry['total_ms'] / entry['calls'] if entry['calls'] else 0.0
+    row['p95_ms'] = samples[min(len(samples) - 1, int(0.95 * len(samples)))] if samples else 0.0
+    return row
+
+
+class SlowQueryLog:
+    def __init__(self, app, db):
+        self.app = app
+        self.threshold = app.config.get('SLOW_QUERY_MS', 100) / 1000
+        self.explain_interval = app.config.get('SLOW_QUERY_EXPLAIN_INTERVAL', 300)
+        self.analyze = app.config.get('SLOW_QUERY_ANALYZE', True)
+        self.max_fingerprints = app.config.get('SLOW_QUERY_MAX_FINGERPRINTS', 1000)
+        self.max_samples = app.config.get('SLOW_QUERY_SAMPLES', 100)
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5.0)
+        self._last_flush = 0.0
+        self._entries = OrderedDict()
+        self._explained = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+        app.after_request(self._after_request)
+        with app.app_context():
+            self.instrument_engine(db.engine)
+        app.extensions['slow_queries'] = self
+
+    # Request hooks
+    def _after_request(self, response):
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return response
+
+    # Engine hooks
+    def instrument_engine(self, engine, async_engine=None):
+        """
+        Time every statement of an engine; connections with execution_options(slow_query_log=False) are skipped.
+
+        For the sync_engine of an AsyncEngine pass the AsyncEngine too, which
+        plans are then captured with; without it they are not captured.
+        """
+        from sqlalchemy import event
+
+        # A sync_engine cannot connect outside its event loop, so only the AsyncEngine can explain
+        explainer = async_engine or (None if engine.dialect.is_async else engine)
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info['slowlog_start'] = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start = conn.info.pop('slowlog_start', None)
+            if start is not None and conn.get_execution_options().get('slow_query_log', True):
+                self.record(explainer, statement, None if executemany else parameters, time.perf_counter() - start)
+
+    def record(self, engine, statement, parameters, elapsed):
+        """Add one execution to the statistics of its fingerprint and queue a plan capture (on ``engine``, if any) if it was slow."""
+        sql = _fingerprint(statement)
+        ms = elapsed * 1e3
+        slow = self.threshold > 0 and elapsed >= self.threshold
+        explain = False
+        with self._lock:
+            entry = self._entries.get(sql)
+            if entry is None:
+                entry = self._entries[sql] = {
+                    'calls': 0, 'slow_calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'samples': deque(maxlen=self.max_samples), 'plan': None, 'plan_at': None, 'plan_ms': None,
+                }
+                while len(self._entries) > self.max_fingerprints:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._explained.pop(evicted, None)
+            self._entries.move_to_end(sql)
+            entry['calls'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['samples'].append(ms)
+            if slow:
+                entry['slow_calls'] += 1
+                now = time.monotonic()
+                # Only one capture per fingerprint per interval, however many slow calls arrive
+                due = now - self._explained.get(sql, -self.explain_interval) >= self.explain_interval
+                if due and engine is not None and parameters is not None and _EXPLAINABLE.match(statement):
+                    self._explained[sql] = now
+                    explain = True
+        if slow:
+            self.app.logger.warning('Slow query (%.1f ms): %s', ms, sql)
+        if explain and isinstance(engine, AsyncEngine):
+            # Statements of an async engine run on its event loop, so the capture can be scheduled
+            # there; from an empty context, so its queries do not count toward this request's
+            task = contextvars.Context().run(
+                asyncio.get_running_loop().create_task, self._capture_plan_async(engine, sql, statement, parameters, ms)
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif explain:
+            self._executor().submit(self._capture_plan, engine, sql, statement, parameters, ms)
+
+    def _executor(self):
+        executor = self.app.extensions.get('explain_executor')
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+            self.app.extensions['explain_executor'] = executor
+        return executor
+
+    def _capture_plan(self, engine, sql, statement, parameters, ms):
+        try:
+            plan = explain_sql(engine, statement, parameters, self.analyze)
+        except Exception as e:
+            plan = [f'EXPLAIN failed: {e}']
+        self._store_plan(sql, plan, ms)
+
+    async def _capture_plan_async(self, engine, sql, statement, parameters, ms):
+        try:
+            plan = await explain_sql_async(engine, statement, parameters, self.analyze)
+        except Exception as e:
+            plan = [f'EXPLAIN failed: {e}']
+        self._store_plan(sql, plan, ms)
+
+    def _store_plan(self, sql, plan, ms):
+        with self._lock:
+            entry = self._entries.get(sql)
+            if entry is not None:
+                entry.update(plan=plan, plan_at=datetime.utcnow().isoformat(), plan_ms=ms)
+
+    # Export
+    def snapshot(self):
+        with self._lock:
+            return [dict(entry, fingerprint=sql, samples=list(entry['samples'])) for sql, entry in self._entries.items()]
+
+    def _path(self):
+        return os.path.join(self.directory, f'slowlog-{os.getpid()}.json')
+
+    def flush(self):
+        """Write this process's log to METRICS_DIR."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self._path())
+        self._last_flush = time.monotonic()
+
+    def report(self, limit=20):
+        """
+        Fingerprints with the most total time, across every process (or just this one without METRICS_DIR).
+
+        Args:
+            limit: Number of fingerprints to return
+
+        Returns:
+            list: dicts with fingerprint, calls, slow_calls, total/mean/p95/max ms and the last captured plan
+        """
+        if not self.directory:
+            merged = merge([self.snapshot()])
+        else:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, 'slowlog-*.json')):
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            merged = merge(snapshots)
+        entries = sorted(merged.values(), key=lambda entry: entry['total_ms'], reverse=True)
+        return [summarize(entry) for entry in entries[:limit]]
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for multi-process servers.
+
+    gunicorn -c app/gunicorn.conf.py app.wsgi:app
+
+With preload_app the app below is built once in the gunicorn master and
+shared copy-on-write by the forked workers; create_app() makes each
+worker open its own database connections.
+"""
+from . import create_app
+
+app = create_app()
@@ -0,0 +1,21 @@
+import pytest
+
+from app import create_app
+from app.models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App bound to a fresh SQLite file with the schema created."""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'SQLALCHEMY_BINDS': {},
+        'HASH_WORKERS': 0,
+        'RATE_LIMIT_PER_SECOND': 0,
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
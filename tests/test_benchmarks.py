@@ -0,0 +1,7 @@
+from app.benchmarks import withdrawals
+
+
+def test_concurrent_withdrawals_keep_the_balance(capsys):
+    # Raises SystemExit on a balance mismatch or an overdraft
+    withdrawals.main(['--workers', '4', '--ops', '25', '--initial', '20'])
+    assert 'balance' in capsys.readouterr().out
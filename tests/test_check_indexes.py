@@ -0,0 +1,4 @@
+def test_hot_queries_use_an_index(app):
+    result = app.test_cli_runner().invoke(args=['check-indexes'])
+    assert result.exit_code == 0, result.output
+    assert 'All hot queries use an index.' in result.output
@@ -0,0 +1,15 @@
+from app.fixtures import rolled_back
+from app.models import db, User, Account
+
+
+def test_rolled_back_discards_commits(app):
+    with rolled_back():
+        User(name='alice', password='password')
+        db.session.commit()
+        Account(user_id=1, initial_balance=100)
+        db.session.commit()
+        assert db.session.query(User).count() == 1
+        assert db.session.get(Account, 1).balance == 100
+
+    assert db.session.query(User).count() == 0
+    assert db.session.query(Account).count() == 0
@@ -0,0 +1,10 @@
+from app import check_query_budgets
+
+
+def test_endpoints_stay_within_their_query_budgets(monkeypatch, capsys):
+    # main() points the environment at its own database; put it back afterwards
+    for name in ('SQLALCHEMY_DATABASE_URI', 'QUERY_BUDGET_MODE', 'RATE_LIMIT_PER_SECOND'):
+        monkeypatch.setenv(name, '')
+    monkeypatch.setenv('HASH_WORKERS', '0')
+    status = check_query_budgets.main()
+    assert status == 0, capsys.readouterr().out